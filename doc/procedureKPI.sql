@@ -544,4 +544,104 @@ BEGIN
         statut = 'En cours'
         AND DATEDIFF(DAY, date_inscription, GETDATE()) > 90;
 END;
-GO
\ No newline at end of file
+GO
+
+-- Procédure stockée: Paires collaborateur/manager pour l'index hiérarchique (scripts/hierarchie.py)
+CREATE PROCEDURE sp_ListerHierarchie
+AS
+BEGIN
+    SET NOCOUNT ON;
+    
+    SELECT 
+        id_collaborateur,
+        id_manager
+    FROM 
+        Collaborateurs;
+END;
+GO
+
+-- Procédure stockée: Collaborateurs avec département, manager, genre et contrat (scripts/obligatoires.py, scripts/agregats.py)
+CREATE PROCEDURE sp_ListerCollaborateurs
+AS
+BEGIN
+    SET NOCOUNT ON;
+    
+    SELECT 
+        id_collaborateur,
+        departement,
+        id_manager,
+        genre,
+        type_contrat
+    FROM 
+        Collaborateurs;
+END;
+GO
+
+-- Procédure stockée: Inscriptions aux formations obligatoires (scripts/obligatoires.py)
+-- Une ligne par formation obligatoire sans inscription (id_collaborateur NULL), sinon une ligne par inscription
+CREATE PROCEDURE sp_ListerInscriptionsObligatoires
+AS
+BEGIN
+    SET NOCOUNT ON;
+    
+    SELECT DISTINCT
+        f.nom_formation,
+        i.id_collaborateur
+    FROM 
+        Formations f
+        LEFT JOIN Inscriptions_Formation i ON f.id_formation = i.id_formation
+    WHERE 
+        f.obligatoire = 1;
+END;
+GO
+
+-- Procédure stockée: Faits d'inscription pour le stock d'agrégats mensuels (scripts/agregats.py)
+CREATE PROCEDURE sp_ExtraireFaitsFormation
+AS
+BEGIN
+    SET NOCOUNT ON;
+    
+    SELECT 
+        i.source_donnee,
+        i.id_collaborateur,
+        f.nom_formation,
+        i.date_inscription,
+        i.statut,
+        i.duree_reelle,
+        f.tarif_ht,
+        c.departement,
+        c.genre,
+        c.type_contrat,
+        cat.nom_categorie
+    FROM 
+        Inscriptions_Formation i
+        INNER JOIN Collaborateurs c ON i.id_collaborateur = c.id_collaborateur
+        INNER JOIN Formations f ON i.id_formation = f.id_formation
+        INNER JOIN Categories_Formation cat ON f.id_categorie = cat.id_categorie;
+END;
+GO
+
+-- Procédure stockée: Instantané des tables de référence pour l'aperçu des KPI (scripts/apercu_kpi.py)
+CREATE PROCEDURE sp_ExtraireReferentiel
+AS
+BEGIN
+    SET NOCOUNT ON;
+    
+    SELECT id_collaborateur, nom_complet, genre, departement, type_contrat
+    FROM Collaborateurs;
+    
+    SELECT id_formation, nom_formation, duree_heures, tarif_ht
+    FROM Formations;
+    
+    SELECT 
+        id_inscription, id_collaborateur, id_formation, id_plan,
+        date_inscription, date_achevement, statut, duree_reelle, source_donnee
+    FROM Inscriptions_Formation;
+    
+    SELECT id_plan, id_budget, id_formation, semestre_validation, budget_alloue
+    FROM Plan_Formation;
+    
+    SELECT id_budget, annee, montant_total
+    FROM Budget_Annuel;
+END;
+GO
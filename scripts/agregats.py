@@ -0,0 +1,429 @@
+"""Stock local d'agrégats mensuels des formations (Parquet partitionné par année/mois).
+
+Les vues ``vw_Evolution_Mensuelle``, ``vw_KPI_Global``, ``vw_Formations_Departement``
+et ``vw_Taux_Formation_Genre`` recalculent tout ``Inscriptions_Formation`` à chaque
+requête. Ce module tient à jour, hors base, les inscriptions, achèvements, heures
+et coûts par mois × département × genre × contrat × catégorie.
+
+Disposition sur disque ::
+
+    racine/faits/annee=2025/mois=3/part.parquet     une ligne par inscription
+    racine/agregats/annee=2025/mois=3/part.parquet  mesures agrégées du mois
+
+Chaque import n'applique que ses deltas, selon les règles de sa procédure :
+
+* SUIVI (``sp_ImporterDonneesSuiviFormation``) : département, genre et contrat
+  du collaborateur et tarif de la formation sont mis à jour sur tous ses faits
+  passés ; une inscription n'est ajoutée que si la paire collaborateur/formation
+  n'existe encore sous aucune source, et un statut existant n'est jamais modifié ;
+* OLU (``sp_ImporterDonneesOLU``) : MERGE sur (collaborateur, formation, OLU),
+  statut et durée mis à jour sur place, date d'inscription conservée ;
+* autre source : remplacement par clé (source, collaborateur, formation).
+
+La catégorie d'une formation est fixée à sa création (le MERGE ``Formations``
+ne met jamais à jour ``id_categorie``) : une nouvelle inscription à une
+formation déjà connue du stock reprend la catégorie de ses faits existants.
+
+La recherche des clés existantes porte sur tous les mois du stock ; seuls les
+mois effectivement modifiés sont réécrits et ré-agrégés. Une reconstruction
+complète périodique depuis ``sp_ExtraireFaitsFormation`` (``--verifier`` /
+``--reconstruire``) détecte et corrige toute dérive.
+
+Usage :
+    python -m scripts.agregats stock_kpi --verifier
+    python -m scripts.agregats stock_kpi --reconstruire
+    python -m scripts.agregats stock_kpi --evolution 2025-01 2025-06
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CLE = ["source", "id_collaborateur", "nom_formation"]
+DIMENSIONS = ["departement", "genre", "contrat", "categorie"]
+PAIRE = ["id_collaborateur", "nom_formation"]
+DIMENSIONS_COLLABORATEUR = ["departement", "genre", "contrat"]
+COLONNES_FAITS = CLE + ["date_inscription", "statut", "duree", "cout"] + DIMENSIONS
+MESURES = ["nombre_inscriptions", "nombre_termines", "heures_terminees", "nombre_durees_terminees", "cout"]
+
+A_COMPLETER = "À compléter"  # valeurs par défaut des procédures d'import
+
+
+# -- conversion des DataFrames nettoyés en faits ---------------------------
+
+
+def faits_suivi(df: pd.DataFrame, jour: date | None = None) -> pd.DataFrame:
+    """Faits d'un fichier SUIVI FORMATIONS nettoyé (``import_suivi_formations.nettoyer``).
+
+    Reproduit les règles de ``sp_ImporterDonneesSuiviFormation`` : date d'inscription
+    = date de début, statut déduit de la date de fin.
+    """
+    jour = jour or date.today()
+    fin = pd.to_datetime(df["AU"])
+    statut = np.select(
+        [fin.isna(), fin < pd.Timestamp(jour)], ["En cours", "Terminé"], default="Inscrit"
+    )
+    return pd.DataFrame(
+        {
+            "source": "SUIVI_INTERNE",
+            "id_collaborateur": df["ID COLLABORATEUR"],
+            "nom_formation": df["NOM FORMATION"],
+            "date_inscription": pd.to_datetime(df["DU"]),
+            "statut": statut,
+            "duree": df["DUREE"],
+            "cout": df["TARIF HT"],
+            "departement": df["DEPARTEMENT"],
+            "genre": df["GENRE"],
+            "contrat": df["CONTRAT"],
+            "categorie": df["CATEGORIE"],
+        }
+    )
+
+
+def faits_olu(df: pd.DataFrame, collaborateurs: pd.DataFrame | None = None) -> pd.DataFrame:
+    """Faits d'un rapport OLU nettoyé (``import_olu.nettoyer``).
+
+    Le rapport ne porte ni département ni contrat : ils sont pris dans
+    ``collaborateurs`` (voir :func:`collaborateurs_base`) lorsqu'il est fourni,
+    sinon ``À compléter`` comme pour un nouveau collaborateur dans
+    ``sp_ImporterDonneesOLU``. La catégorie est celle d'une formation créée par
+    la procédure ; ``StockAgregats.appliquer`` garde celle d'une formation connue.
+    """
+    ids = df["Utilisateur - ID d'utilisateur"]
+    faits = pd.DataFrame(
+        {
+            "source": "OLU",
+            "id_collaborateur": ids,
+            "nom_formation": df["Formation - Titre de la formation"],
+            "date_inscription": pd.to_datetime(df["Récapitulatif - Date d'inscription"]),
+            "statut": df["Récapitulatif - Statut"],
+            "duree": df["Formation - Heures de formation"],
+            "cout": np.nan,
+            "departement": A_COMPLETER,
+            "genre": df["Utilisateur - Sexe de l'utilisateur"].fillna("Non spécifié"),
+            "contrat": A_COMPLETER,
+            "categorie": "Technique - Métiers",
+        }
+    )
+    if collaborateurs is not None:
+        faits = avec_collaborateurs(faits, collaborateurs)
+    return faits
+
+
+def concatener(extraits: list[pd.DataFrame]) -> pd.DataFrame:
+    """Faits extraits bloc par bloc en mode pipeline ; aucun bloc si le fichier n'a pas de ligne de données."""
+    if not extraits:
+        return pd.DataFrame(columns=COLONNES_FAITS)
+    return pd.concat(extraits, ignore_index=True)
+
+
+def avec_collaborateurs(faits: pd.DataFrame, collaborateurs: pd.DataFrame) -> pd.DataFrame:
+    """Remplace département, genre et contrat par les valeurs de la base.
+
+    ``collaborateurs`` est indexé par ``id_collaborateur`` ; les collaborateurs
+    absents gardent les valeurs des faits.
+    """
+    faits = faits.copy()
+    reference = collaborateurs.reindex(faits["id_collaborateur"].to_numpy())
+    for col in DIMENSIONS_COLLABORATEUR:
+        valeurs = reference[col].to_numpy(dtype=object)
+        faits[col] = np.where(pd.isna(valeurs), faits[col].to_numpy(dtype=object), valeurs)
+    return faits
+
+
+def collaborateurs_base() -> pd.DataFrame:
+    """Département, genre et contrat actuels des collaborateurs (``sp_ListerCollaborateurs``)."""
+    from . import db
+
+    (collaborateurs,) = db.fetch_dataframes("sp_ListerCollaborateurs")
+    return collaborateurs.rename(columns={"type_contrat": "contrat"}).set_index("id_collaborateur")[
+        DIMENSIONS_COLLABORATEUR
+    ]
+
+
+def faits_base() -> pd.DataFrame:
+    """Tous les faits actuels de la base, pour la reconstruction complète."""
+    from . import db
+
+    (faits,) = db.fetch_dataframes("sp_ExtraireFaitsFormation")
+    # Noms de colonnes de la base -> noms du stock
+    faits.columns = COLONNES_FAITS
+    return faits
+
+
+# -- agrégation ------------------------------------------------------------
+
+
+def agreger(faits: pd.DataFrame) -> pd.DataFrame:
+    """Agrège des faits au grain mois × département × genre × contrat × catégorie."""
+    termine = faits["statut"].eq("Terminé")
+    duree = pd.to_numeric(faits["duree"], errors="coerce")
+    mesures = pd.DataFrame(
+        {
+            "annee": faits["date_inscription"].dt.year,
+            "mois": faits["date_inscription"].dt.month,
+            **{d: faits[d].fillna(A_COMPLETER) for d in DIMENSIONS},
+            "nombre_inscriptions": 1,
+            "nombre_termines": termine.astype(int),
+            "heures_terminees": duree.where(termine, 0.0).fillna(0.0),
+            "nombre_durees_terminees": (termine & duree.notna()).astype(int),
+            "cout": pd.to_numeric(faits["cout"], errors="coerce").fillna(0.0),
+        }
+    )
+    return (
+        mesures.dropna(subset=["annee", "mois"])
+        .astype({"annee": int, "mois": int})
+        .groupby(["annee", "mois"] + DIMENSIONS, as_index=False, sort=True)[MESURES]
+        .sum()
+    )
+
+
+def _normaliser(faits: pd.DataFrame) -> pd.DataFrame:
+    faits = faits[COLONNES_FAITS].copy()
+    faits["date_inscription"] = pd.to_datetime(faits["date_inscription"])
+    for col in ("duree", "cout"):
+        faits[col] = pd.to_numeric(faits[col], errors="coerce")
+    sans_date = faits["date_inscription"].isna()
+    if sans_date.any():
+        logger.warning("%d faits sans date d'inscription ignorés", int(sans_date.sum()))
+    # Dernière occurrence prioritaire, comme un MERGE ligne à ligne.
+    return faits[~sans_date].drop_duplicates(CLE, keep="last")
+
+
+class StockAgregats:
+    def __init__(self, racine: Path):
+        self.racine = Path(racine)
+
+    def _chemin(self, niveau: str, annee: int, mois: int) -> Path:
+        return self.racine / niveau / f"annee={annee}" / f"mois={mois}" / "part.parquet"
+
+    def _ecrire(self, df: pd.DataFrame, chemin: Path) -> None:
+        chemin.parent.mkdir(parents=True, exist_ok=True)
+        tmp = chemin.with_suffix(".tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, chemin)
+
+    def partitions(self) -> list[tuple[int, int]]:
+        return sorted(
+            (int(p.parent.parent.name.split("=")[1]), int(p.parent.name.split("=")[1]))
+            for p in (self.racine / "agregats").glob("annee=*/mois=*/part.parquet")
+        )
+
+    def _index(self) -> pd.DataFrame:
+        """Clés, coût et catégorie de tous les faits stockés, avec leur mois (lecture des seules colonnes utiles)."""
+        morceaux = []
+        for chemin in (self.racine / "faits").glob("annee=*/mois=*/part.parquet"):
+            cles = pd.read_parquet(chemin, columns=CLE + ["cout", "categorie"])
+            cles["annee"] = int(chemin.parent.parent.name.split("=")[1])
+            cles["mois"] = int(chemin.parent.name.split("=")[1])
+            morceaux.append(cles)
+        if not morceaux:
+            return pd.DataFrame(columns=CLE + ["cout", "categorie", "annee", "mois"])
+        return pd.concat(morceaux, ignore_index=True)
+
+    def appliquer(self, faits: pd.DataFrame) -> list[tuple[int, int]]:
+        """Applique les faits d'un import selon les règles de sa procédure, puis ré-agrège les mois modifiés."""
+        faits = _normaliser(faits)
+        index = self._index()
+        modifies: dict[tuple[int, int], pd.DataFrame] = {}
+
+        def partition(annee: int, mois: int) -> pd.DataFrame:
+            cle = (int(annee), int(mois))
+            if cle not in modifies:
+                chemin = self._chemin("faits", *cle)
+                modifies[cle] = pd.read_parquet(chemin) if chemin.exists() else pd.DataFrame(columns=COLONNES_FAITS)
+            return modifies[cle]
+
+        def mois_de(masque: pd.Series) -> list[tuple[int, int]]:
+            mois = index.loc[masque, ["annee", "mois"]].drop_duplicates()
+            return [(int(a), int(m)) for a, m in mois.itertuples(index=False, name=None)]
+
+        categories = (
+            index.dropna(subset=["categorie"])
+            .drop_duplicates("nom_formation", keep="last")
+            .set_index("nom_formation")["categorie"]
+        )
+
+        def categorie(nouveaux: pd.DataFrame) -> pd.Series:
+            # Formation déjà connue : sa catégorie ; sinon celle de la création par la procédure
+            return nouveaux["nom_formation"].map(categories).fillna(nouveaux["categorie"])
+
+        suivi = faits[faits["source"].eq("SUIVI_INTERNE")]
+        olu = faits[faits["source"].eq("OLU")]
+        autres = faits[~faits["source"].isin(["SUIVI_INTERNE", "OLU"])]
+
+        if len(suivi):
+            # MERGE Collaborateurs et Formations : valeurs à jour sur tous les faits existants
+            dimensions = suivi.drop_duplicates("id_collaborateur", keep="last").set_index("id_collaborateur")
+            tarifs = suivi.drop_duplicates("nom_formation", keep="last").set_index("nom_formation")["cout"]
+            concernes = index["id_collaborateur"].isin(dimensions.index) | index["nom_formation"].isin(tarifs.index)
+            for annee, mois in mois_de(concernes):
+                p = partition(annee, mois)
+                sel = p["id_collaborateur"].isin(dimensions.index)
+                for col in DIMENSIONS_COLLABORATEUR:
+                    p.loc[sel, col] = p.loc[sel, "id_collaborateur"].map(dimensions[col])
+                sel = p["nom_formation"].isin(tarifs.index)
+                p.loc[sel, "cout"] = p.loc[sel, "nom_formation"].map(tarifs)
+            # Insertion seulement si la paire n'existe sous aucune source ; jamais de mise à jour du statut
+            deja = pd.MultiIndex.from_frame(suivi[PAIRE]).isin(pd.MultiIndex.from_frame(index[PAIRE]))
+            suivi = suivi[~deja].assign(cout=suivi.loc[~deja, "nom_formation"].map(tarifs))
+            suivi["categorie"] = categorie(suivi)
+            for col in DIMENSIONS_COLLABORATEUR:
+                suivi[col] = suivi["id_collaborateur"].map(dimensions[col])
+
+        if len(olu):
+            # MERGE (collaborateur, formation, OLU) : statut et durée mis à jour, date conservée
+            existants = index["source"].eq("OLU")
+            cles_olu = pd.MultiIndex.from_frame(olu[CLE])
+            correspond = cles_olu.isin(pd.MultiIndex.from_frame(index.loc[existants, CLE]))
+            maj = olu[correspond].set_index(CLE)
+            cibles = existants & pd.MultiIndex.from_frame(index[CLE]).isin(maj.index)
+            for annee, mois in mois_de(cibles):
+                p = partition(annee, mois)
+                sel = pd.MultiIndex.from_frame(p[CLE]).isin(maj.index)
+                cles = pd.MultiIndex.from_frame(p.loc[sel, CLE])
+                for col in ("statut", "duree"):
+                    p.loc[sel, col] = maj[col].reindex(cles).to_numpy()
+            # Le coût d'une inscription est le tarif de sa formation
+            tarifs = index.drop_duplicates("nom_formation", keep="last").set_index("nom_formation")["cout"]
+            olu = olu[~correspond].assign(cout=olu.loc[~correspond, "nom_formation"].map(tarifs))
+            olu["categorie"] = categorie(olu)
+
+        if len(autres):
+            # Remplacement par clé, quel que soit le mois où la clé était rangée
+            remplaces = pd.MultiIndex.from_frame(index[CLE]).isin(pd.MultiIndex.from_frame(autres[CLE]))
+            for annee, mois in mois_de(remplaces):
+                p = partition(annee, mois)
+                garde = ~pd.MultiIndex.from_frame(p[CLE]).isin(pd.MultiIndex.from_frame(autres[CLE]))
+                modifies[(annee, mois)] = p[garde]
+
+        nouveaux = pd.concat([suivi, olu, autres], ignore_index=True)
+        for (annee, mois), groupe in nouveaux.groupby(
+            [nouveaux["date_inscription"].dt.year, nouveaux["date_inscription"].dt.month], sort=True
+        ):
+            p = partition(annee, mois)
+            modifies[(int(annee), int(mois))] = groupe if p.empty else pd.concat([p, groupe], ignore_index=True)
+
+        for (annee, mois), p in sorted(modifies.items()):
+            if p.empty:
+                for niveau in ("faits", "agregats"):
+                    self._chemin(niveau, annee, mois).unlink(missing_ok=True)
+                continue
+            self._ecrire(p, self._chemin("faits", annee, mois))
+            self._ecrire(agreger(p), self._chemin("agregats", annee, mois))
+        logger.info("Agrégats mis à jour pour %d mois (%d faits ajoutés)", len(modifies), len(nouveaux))
+        return sorted(modifies)
+
+    def lire(
+        self, debut: tuple[int, int] | None = None, fin: tuple[int, int] | None = None
+    ) -> pd.DataFrame:
+        """Agrégats des seuls mois compris entre ``debut`` et ``fin`` (inclus)."""
+        morceaux = [
+            pd.read_parquet(self._chemin("agregats", a, m))
+            for a, m in self.partitions()
+            if (debut is None or (a, m) >= debut) and (fin is None or (a, m) <= fin)
+        ]
+        if not morceaux:
+            return pd.DataFrame(columns=["annee", "mois"] + DIMENSIONS + MESURES)
+        return pd.concat(morceaux, ignore_index=True)
+
+    def reconstruire(self, faits: pd.DataFrame) -> None:
+        """Réécrit tout le stock à partir de l'ensemble des faits."""
+        faits = _normaliser(faits)
+        anciennes = set(self.partitions())
+        nouvelles = set(self._ecrire_tout(faits))
+        for annee, mois in anciennes - nouvelles:
+            for niveau in ("faits", "agregats"):
+                self._chemin(niveau, annee, mois).unlink(missing_ok=True)
+        logger.info("Stock reconstruit: %d mois", len(nouvelles))
+
+    def _ecrire_tout(self, faits: pd.DataFrame) -> list[tuple[int, int]]:
+        touches = []
+        for (annee, mois), groupe in faits.groupby(
+            [faits["date_inscription"].dt.year, faits["date_inscription"].dt.month]
+        ):
+            self._ecrire(groupe, self._chemin("faits", annee, mois))
+            self._ecrire(agreger(groupe), self._chemin("agregats", annee, mois))
+            touches.append((int(annee), int(mois)))
+        return touches
+
+    def verifier(self, faits: pd.DataFrame) -> pd.DataFrame:
+        """Compare le stock à une agrégation complète au grain mois × dimensions ; retourne les écarts."""
+        grain = ["annee", "mois"] + DIMENSIONS
+        attendu = agreger(_normaliser(faits)).set_index(grain)[MESURES]
+        stocke = self.lire().groupby(grain)[MESURES].sum()
+        ecarts = attendu.sub(stocke, fill_value=0).fillna(0)
+        ecarts = ecarts[(ecarts.abs() > 1e-6).any(axis=1)]
+        if len(ecarts):
+            mois = ecarts.index.droplevel(DIMENSIONS).unique()
+            logger.warning("Dérive détectée sur %d cellules (%d mois)", len(ecarts), len(mois))
+        else:
+            logger.info("Aucune dérive entre le stock et la base")
+        return ecarts
+
+
+# -- requêtes équivalentes aux vues ----------------------------------------
+
+
+def evolution_mensuelle(agregats: pd.DataFrame) -> pd.DataFrame:
+    """Équivalent de ``vw_Evolution_Mensuelle``."""
+    mois = agregats.groupby(["annee", "mois"], as_index=False)[MESURES].sum()
+    return pd.DataFrame(
+        {
+            "annee": mois["annee"],
+            "mois": mois["mois"],
+            "nouvelles_inscriptions": mois["nombre_inscriptions"],
+            "formations_terminees": mois["nombre_termines"],
+            "duree_moyenne": mois["heures_terminees"] / mois["nombre_durees_terminees"].replace(0, np.nan),
+        }
+    )
+
+
+def par_dimension(agregats: pd.DataFrame, dimension: str) -> pd.DataFrame:
+    """Inscriptions, achèvements, heures et coûts par ``departement``, ``genre``, ``contrat`` ou ``categorie``."""
+    resultat = agregats.groupby(dimension)[MESURES].sum()
+    resultat["duree_moyenne_par_formation"] = resultat["heures_terminees"] / resultat[
+        "nombre_durees_terminees"
+    ].replace(0, np.nan)
+    return resultat.drop(columns="nombre_durees_terminees")
+
+
+def _mois(texte: str) -> tuple[int, int]:
+    annee, mois = texte.split("-")
+    return int(annee), int(mois)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    ap = argparse.ArgumentParser(description="Stock d'agrégats mensuels des formations")
+    ap.add_argument("racine", type=Path, help="Répertoire du stock Parquet")
+    action = ap.add_mutually_exclusive_group(required=True)
+    action.add_argument("--verifier", action="store_true", help="Compare le stock à la base")
+    action.add_argument("--reconstruire", action="store_true", help="Reconstruit le stock depuis la base")
+    action.add_argument(
+        "--evolution", nargs=2, metavar=("DEBUT", "FIN"), type=_mois, help="Évolution mensuelle YYYY-MM YYYY-MM"
+    )
+    args = ap.parse_args()
+
+    stock = StockAgregats(args.racine)
+    if args.evolution:
+        print(evolution_mensuelle(stock.lire(*args.evolution)).to_string(index=False))
+    elif args.reconstruire:
+        stock.reconstruire(faits_base())
+    else:
+        ecarts = stock.verifier(faits_base())
+        if len(ecarts):
+            print(ecarts.to_string())
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""Aperçu hors ligne de l'effet d'un import sur les KPI.
+
+Avant un import mensuel, rejoue en mémoire la logique des procédures
+``sp_Importer*`` sur un instantané local des tables de référence, puis
+recalcule par group-by vectorisés les indicateurs de ``vw_KPI_Global``,
+``vw_Formations_Departement``, ``vw_Taux_Realisation_Plan`` et
+``vw_Suivi_Budget``. Le résultat est un différentiel avant/après, obtenu sans
+toucher à la base de production.
+
+L'instantané est lu une fois via ``sp_ExtraireReferentiel`` et mis en cache en
+Parquet ; ``--rafraichir`` le recharge.
+
+Usage :
+    python -m scripts.apercu_kpi --referentiel cache_ref --rafraichir
+    python -m scripts.apercu_kpi --referentiel cache_ref --suivi suivi.xlsx --olu olu.xlsx --date 2025-05-20
+    python -m scripts.apercu_kpi --referentiel cache_ref --plan plan.xlsx --budget budget.xlsx --annee 2025
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+from dataclasses import dataclass, fields, replace
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("apercu_kpi")
+
+A_COMPLETER = "À compléter"
+
+
+@dataclass
+class Referentiel:
+    """Instantané des tables utiles aux KPI (colonnes de ``sp_ExtraireReferentiel``)."""
+
+    collaborateurs: pd.DataFrame  # id_collaborateur, nom_complet, genre, departement, type_contrat
+    formations: pd.DataFrame  # id_formation, nom_formation, duree_heures, tarif_ht
+    inscriptions: pd.DataFrame  # id_inscription, id_collaborateur, id_formation, id_plan,
+    #                             date_inscription, date_achevement, statut, duree_reelle, source_donnee
+    plan: pd.DataFrame  # id_plan, id_budget, id_formation, semestre_validation, budget_alloue
+    budgets: pd.DataFrame  # id_budget, annee, montant_total
+
+    @classmethod
+    def charger(cls) -> "Referentiel":
+        from . import db
+
+        return cls(*db.fetch_dataframes("sp_ExtraireReferentiel"))
+
+    @classmethod
+    def lire(cls, dossier: Path) -> "Referentiel":
+        return cls(**{f.name: pd.read_parquet(dossier / f"{f.name}.parquet") for f in fields(cls)})
+
+    def sauvegarder(self, dossier: Path) -> None:
+        dossier.mkdir(parents=True, exist_ok=True)
+        for f in fields(self):
+            getattr(self, f.name).to_parquet(dossier / f"{f.name}.parquet", index=False)
+
+
+# -- rejeu des procédures d'import -----------------------------------------
+
+
+def _nouveaux_ids(existants: pd.Series, n: int) -> np.ndarray:
+    depart = int(existants.max()) + 1 if len(existants) and existants.notna().any() else 1
+    return np.arange(depart, depart + n)
+
+
+def _ajouter_formations(ref: Referentiel, noms: pd.Series, duree=None, tarif=None) -> pd.DataFrame:
+    """Crée les formations inconnues ; retourne la table des formations à jour."""
+    nouvelles = pd.DataFrame({"nom_formation": noms, "duree_heures": duree, "tarif_ht": tarif})
+    nouvelles = nouvelles.dropna(subset=["nom_formation"]).drop_duplicates("nom_formation")
+    nouvelles = nouvelles[~nouvelles["nom_formation"].isin(ref.formations["nom_formation"])]
+    nouvelles.insert(0, "id_formation", _nouveaux_ids(ref.formations["id_formation"], len(nouvelles)))
+    return pd.concat([ref.formations, nouvelles], ignore_index=True)
+
+
+def _ajouter_inscriptions(ref: Referentiel, nouvelles: pd.DataFrame) -> pd.DataFrame:
+    nouvelles = nouvelles.copy()
+    nouvelles.insert(0, "id_inscription", _nouveaux_ids(ref.inscriptions["id_inscription"], len(nouvelles)))
+    return pd.concat([ref.inscriptions, nouvelles], ignore_index=True)
+
+
+def _id_formation(ref: Referentiel, noms: pd.Series) -> pd.Series:
+    return noms.map(ref.formations.set_index("nom_formation")["id_formation"])
+
+
+def appliquer_suivi(ref: Referentiel, df: pd.DataFrame, jour: date) -> Referentiel:
+    """Rejoue ``sp_ImporterDonneesSuiviFormation`` sur un DataFrame nettoyé."""
+    source = df.rename(
+        columns={"ID COLLABORATEUR": "id_collaborateur", "GENRE": "genre", "DEPARTEMENT": "departement", "CONTRAT": "type_contrat"}
+    )
+    colonnes = ["genre", "departement", "type_contrat"]
+    maj = source.drop_duplicates("id_collaborateur", keep="last").set_index("id_collaborateur")[colonnes]
+    # MERGE : mise à jour des existants (nom_complet et manager conservés), insertion des autres
+    collaborateurs = ref.collaborateurs.copy()
+    existants = collaborateurs["id_collaborateur"].isin(maj.index)
+    for col in colonnes:
+        collaborateurs.loc[existants, col] = collaborateurs.loc[existants, "id_collaborateur"].map(maj[col])
+    nouveaux = maj[~maj.index.isin(collaborateurs["id_collaborateur"])].reset_index()
+    ref = replace(ref, collaborateurs=pd.concat([collaborateurs, nouveaux], ignore_index=True))
+    ref = replace(ref, formations=_ajouter_formations(ref, df["NOM FORMATION"], df["DUREE"], df["TARIF HT"]))
+
+    debut, fin = pd.to_datetime(df["DU"]), pd.to_datetime(df["AU"])
+    lignes = pd.DataFrame(
+        {
+            "id_collaborateur": df["ID COLLABORATEUR"],
+            "id_formation": _id_formation(ref, df["NOM FORMATION"]),
+            "id_plan": np.nan,
+            "date_inscription": debut,
+            "date_achevement": pd.NaT,
+            "statut": np.select([fin.isna(), fin < pd.Timestamp(jour)], ["En cours", "Terminé"], "Inscrit"),
+            "duree_reelle": df["DUREE"],
+            "source_donnee": "SUIVI_INTERNE",
+        }
+    )
+    # Insertion seulement si la paire collaborateur/formation n'existe pas déjà (toutes sources)
+    existantes = pd.MultiIndex.from_frame(ref.inscriptions[["id_collaborateur", "id_formation"]])
+    deja = pd.MultiIndex.from_frame(lignes[["id_collaborateur", "id_formation"]]).isin(existantes)
+    return replace(ref, inscriptions=_ajouter_inscriptions(ref, lignes[~deja]))
+
+
+def appliquer_olu(ref: Referentiel, df: pd.DataFrame) -> Referentiel:
+    """Rejoue ``sp_ImporterDonneesOLU`` sur un DataFrame nettoyé."""
+    ids = df["Utilisateur - ID d'utilisateur"]
+    nouveaux = pd.DataFrame(
+        {
+            "id_collaborateur": ids,
+            "genre": df["Utilisateur - Sexe de l'utilisateur"].fillna("Non spécifié"),
+            "departement": A_COMPLETER,
+            "type_contrat": A_COMPLETER,
+        }
+    ).drop_duplicates("id_collaborateur")
+    nouveaux = nouveaux[~nouveaux["id_collaborateur"].isin(ref.collaborateurs["id_collaborateur"])]
+    collaborateurs = pd.concat([ref.collaborateurs, nouveaux], ignore_index=True)
+
+    # Étape 2 : managers inconnus (par nom complet) créés en collaborateurs fictifs MGR_...
+    noms = collaborateurs["nom_complet"] if "nom_complet" in collaborateurs else pd.Series(dtype=object)
+    managers = df["Utilisateur - Manager - Nom complet"].dropna().drop_duplicates()
+    managers = managers[~managers.isin(noms)]
+    fictifs = pd.DataFrame(
+        {
+            "id_collaborateur": "MGR_" + managers.str.replace(" ", "").str.replace(",", ""),
+            "nom_complet": managers,
+            "genre": "Non spécifié",
+            "departement": A_COMPLETER,
+            "type_contrat": A_COMPLETER,
+        }
+    )
+    ref = replace(ref, collaborateurs=pd.concat([collaborateurs, fictifs], ignore_index=True))
+    ref = replace(
+        ref,
+        formations=_ajouter_formations(
+            ref, df["Formation - Titre de la formation"], df["Formation - Heures de formation"]
+        ),
+    )
+
+    lignes = pd.DataFrame(
+        {
+            "id_collaborateur": ids,
+            "id_formation": _id_formation(ref, df["Formation - Titre de la formation"]),
+            "date_inscription": pd.to_datetime(df["Récapitulatif - Date d'inscription"]),
+            "date_achevement": pd.to_datetime(df["Récapitulatif - Date d'achèvement"]),
+            "statut": df["Récapitulatif - Statut"],
+            "duree_reelle": df["Formation - Heures de formation"],
+        }
+    ).drop_duplicates(["id_collaborateur", "id_formation"], keep="last")
+
+    # MERGE sur (collaborateur, formation, source OLU)
+    inscriptions = ref.inscriptions
+    olu = inscriptions["source_donnee"].eq("OLU")
+    cle_existante = pd.MultiIndex.from_frame(inscriptions.loc[olu, ["id_collaborateur", "id_formation"]])
+    cle_source = pd.MultiIndex.from_frame(lignes[["id_collaborateur", "id_formation"]])
+    correspond = cle_source.isin(cle_existante)
+
+    maj = lignes[correspond].set_index(["id_collaborateur", "id_formation"])
+    if len(maj):
+        inscriptions = inscriptions.copy()
+        cibles = olu & pd.MultiIndex.from_frame(inscriptions[["id_collaborateur", "id_formation"]]).isin(maj.index)
+        cles = pd.MultiIndex.from_frame(inscriptions.loc[cibles, ["id_collaborateur", "id_formation"]])
+        for col in ("statut", "date_achevement", "duree_reelle"):
+            inscriptions.loc[cibles, col] = maj[col].reindex(cles).to_numpy()
+        ref = replace(ref, inscriptions=inscriptions)
+
+    ajouts = lignes[~correspond].assign(id_plan=np.nan, source_donnee="OLU")
+    return replace(ref, inscriptions=_ajouter_inscriptions(ref, ajouts))
+
+
+def _budget(ref: Referentiel, annee: int, montant: float | None = None) -> tuple[Referentiel, int]:
+    budgets = ref.budgets
+    existe = budgets["annee"].eq(annee)
+    if not existe.any():
+        id_budget = int(_nouveaux_ids(budgets["id_budget"], 1)[0])
+        ligne = pd.DataFrame({"id_budget": [id_budget], "annee": [annee], "montant_total": [montant or 0.0]})
+        return replace(ref, budgets=pd.concat([budgets, ligne], ignore_index=True)), id_budget
+    id_budget = int(budgets.loc[existe, "id_budget"].iloc[0])
+    if montant is not None:
+        budgets = budgets.copy()
+        budgets.loc[existe, "montant_total"] = montant
+        ref = replace(ref, budgets=budgets)
+    return ref, id_budget
+
+
+def _fusionner_plan(ref: Referentiel, id_budget: int, lignes: pd.DataFrame) -> Referentiel:
+    """MERGE ``Plan_Formation`` sur (budget, formation) pour les formations connues."""
+    lignes = lignes.dropna(subset=["id_formation"]).drop_duplicates("id_formation", keep="last")
+    lignes = lignes.astype({"id_formation": "int64"})
+    plan = ref.plan.copy()
+    du_budget = plan["id_budget"].eq(id_budget)
+    existant = plan.loc[du_budget, "id_formation"]
+    valeurs = lignes.set_index("id_formation")
+    cibles = du_budget & plan["id_formation"].isin(valeurs.index)
+    for col in valeurs.columns:
+        plan.loc[cibles, col] = valeurs[col].reindex(plan.loc[cibles, "id_formation"]).to_numpy()
+    nouvelles = lignes[~lignes["id_formation"].isin(existant)].assign(id_budget=id_budget)
+    nouvelles.insert(0, "id_plan", _nouveaux_ids(plan["id_plan"], len(nouvelles)))
+    return replace(ref, plan=pd.concat([plan, nouvelles], ignore_index=True))
+
+
+def appliquer_recueil(ref: Referentiel, df: pd.DataFrame, annee: int) -> Referentiel:
+    """Rejoue ``sp_ImporterRecueilBesoins`` : seul le budget de l'année (montant 0) touche ces KPI.
+
+    Les demandes créées ne figurent dans aucun des indicateurs calculés ici.
+    """
+    return _budget(ref, annee)[0]
+
+
+def appliquer_plan(ref: Referentiel, df: pd.DataFrame, annee: int) -> Referentiel:
+    """Rejoue ``sp_ImporterPlanFormation`` : plan de l'année puis total du budget annuel."""
+    ref, id_budget = _budget(ref, annee)
+    lignes = pd.DataFrame(
+        {
+            "id_formation": _id_formation(ref, df["NOM FORMATION"]),
+            "semestre_validation": 1,
+            "budget_alloue": df["BUDGET"],
+        }
+    )
+    ref = _fusionner_plan(ref, id_budget, lignes)
+    total = ref.plan.loc[ref.plan["id_budget"].eq(id_budget), "budget_alloue"].sum()
+    return _budget(ref, annee, float(total))[0]
+
+
+def appliquer_budget(ref: Referentiel, df: pd.DataFrame, annee: int) -> Referentiel:
+    """Rejoue ``sp_ImporterBudgetFormation`` : total annuel puis allocations du plan."""
+    ref, id_budget = _budget(ref, annee, float(df["BUDGET"].sum()))
+    lignes = pd.DataFrame(
+        {
+            "id_formation": _id_formation(ref, df["NOM FORMATION"]),
+            "semestre_validation": df["SEMESTRE DE VALIDATION"],
+            "budget_alloue": df["BUDGET"],
+        }
+    )
+    return _fusionner_plan(ref, id_budget, lignes)
+
+
+# -- KPI -------------------------------------------------------------------
+
+
+def kpi_global(ref: Referentiel) -> pd.DataFrame:
+    """Équivalent de ``vw_KPI_Global`` (une ligne)."""
+    ins = ref.inscriptions
+    termine = ins["statut"].eq("Terminé")
+    duree = pd.to_numeric(ins.loc[termine, "duree_reelle"], errors="coerce")
+    return pd.DataFrame(
+        {
+            "nombre_total_collaborateurs": [len(ref.collaborateurs)],
+            "nombre_total_formations": [len(ref.formations)],
+            "nombre_total_inscriptions": [len(ins)],
+            "nombre_formations_terminees": [int(termine.sum())],
+            "nombre_formations_en_cours": [int(ins["statut"].eq("En cours").sum())],
+            "nombre_formations_inscrites": [int(ins["statut"].eq("Inscrit").sum())],
+            "heures_formation_totales": [duree.sum()],
+            "moyenne_heures_par_formation": [duree.mean()],
+            "taux_realisation": [termine.sum() / len(ins) if len(ins) else np.nan],
+        }
+    )
+
+
+def formations_departement(ref: Referentiel) -> pd.DataFrame:
+    """Équivalent de ``vw_Formations_Departement``."""
+    ins = ref.inscriptions.merge(ref.collaborateurs[["id_collaborateur", "departement"]], on="id_collaborateur")
+    termine = ins["statut"].eq("Terminé")
+    duree = pd.to_numeric(ins["duree_reelle"], errors="coerce").where(termine)
+    par_dept = pd.DataFrame(
+        {
+            "departement": ins["departement"],
+            "nombre_inscriptions": 1,
+            "nombre_termines": termine.astype(int),
+            "heures": duree.fillna(0.0),
+            "duree": duree,
+        }
+    ).groupby("departement").agg(
+        nombre_inscriptions=("nombre_inscriptions", "sum"),
+        nombre_termines=("nombre_termines", "sum"),
+        heures_terminees=("heures", "sum"),
+        duree_moyenne_par_formation=("duree", "mean"),
+    )
+    effectifs = ref.collaborateurs.groupby("departement").size().rename("nombre_collaborateurs")
+    resultat = pd.concat([effectifs, par_dept], axis=1).fillna(
+        {"nombre_inscriptions": 0, "nombre_termines": 0, "heures_terminees": 0.0}
+    )
+    resultat["heures_par_collaborateur"] = resultat["heures_terminees"] / resultat["nombre_collaborateurs"]
+    return resultat.rename_axis("departement")
+
+
+def taux_realisation_plan(ref: Referentiel) -> pd.DataFrame:
+    """Équivalent de ``vw_Taux_Realisation_Plan``."""
+    plan = ref.plan.merge(ref.budgets[["id_budget", "annee"]], on="id_budget")
+    liees = plan.merge(
+        ref.inscriptions[["id_inscription", "id_plan", "id_formation", "statut"]],
+        on=["id_plan", "id_formation"],
+    )
+    resultat = pd.DataFrame(
+        {
+            "nombre_formations_planifiees": plan.groupby("annee")["id_plan"].nunique(),
+            "nombre_inscriptions_realisees": liees.groupby("annee")["id_inscription"].nunique(),
+            "nombre_formations_terminees": liees["statut"].eq("Terminé").groupby(liees["annee"]).sum(),
+        }
+    ).fillna(0)
+    planifiees = resultat["nombre_formations_planifiees"].replace(0, np.nan)
+    resultat["taux_inscriptions"] = (resultat["nombre_inscriptions_realisees"] * 100.0 / planifiees).round(2)
+    resultat["taux_realisation"] = (resultat["nombre_formations_terminees"] * 100.0 / planifiees).round(2)
+    return resultat.rename_axis("annee")
+
+
+def suivi_budget(ref: Referentiel) -> pd.DataFrame:
+    """Équivalent de ``vw_Suivi_Budget``."""
+    alloue = ref.plan.groupby("id_budget")["budget_alloue"].sum(min_count=1)
+    resultat = ref.budgets.set_index("id_budget")[["annee", "montant_total"]].join(alloue)
+    resultat = resultat.rename(columns={"montant_total": "budget_total"})
+    consomme = resultat["budget_alloue"].fillna(0)
+    resultat["budget_restant"] = resultat["budget_total"] - consomme
+    resultat["pourcentage_consommation"] = consomme / resultat["budget_total"].replace(0, np.nan) * 100
+    return resultat.set_index("annee").sort_index()
+
+
+INDICATEURS = {
+    "kpi_global": kpi_global,
+    "formations_departement": formations_departement,
+    "taux_realisation_plan": taux_realisation_plan,
+    "suivi_budget": suivi_budget,
+}
+
+
+def calculer(ref: Referentiel) -> dict[str, pd.DataFrame]:
+    return {nom: fonction(ref) for nom, fonction in INDICATEURS.items()}
+
+
+def comparer(avant: dict[str, pd.DataFrame], apres: dict[str, pd.DataFrame]) -> dict[str, pd.DataFrame]:
+    """Différentiel par indicateur au format long (clé, mesure) → avant / après / écart.
+
+    Seules les valeurs modifiées sont conservées.
+    """
+    diffs = {}
+    for nom in avant:
+        a, b = avant[nom].astype(float).align(apres[nom].astype(float), join="outer")
+        index = pd.MultiIndex.from_product([a.index, a.columns], names=[a.index.name, "mesure"])
+        diff = pd.DataFrame({"avant": a.to_numpy().ravel(), "apres": b.to_numpy().ravel()}, index=index)
+        diff["ecart"] = diff["apres"].fillna(0) - diff["avant"].fillna(0)
+        identiques = np.isclose(diff["avant"].fillna(0), diff["apres"].fillna(0)) & (
+            diff["avant"].isna() == diff["apres"].isna()
+        )
+        diffs[nom] = diff[~identiques]
+    return diffs
+
+
+def _preparer(module, path: Path) -> pd.DataFrame:
+    """Lecture, filtrage qualité et nettoyage d'un fichier avec les fonctions de son script d'import."""
+    from . import validation
+
+    rapport = validation.valider(module.lire_excel(path), module.REGLES)
+    if len(rapport.quarantaine):
+        logger.warning("%s: %d lignes invalides ignorées dans l'aperçu", path.name, len(rapport.quarantaine))
+    return module.nettoyer(rapport.propres)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    ap = argparse.ArgumentParser(description="Aperçu hors ligne de l'effet d'un import sur les KPI")
+    ap.add_argument("--referentiel", type=Path, required=True, help="Dossier du cache de l'instantané")
+    ap.add_argument("--rafraichir", action="store_true", help="Recharge l'instantané depuis la base")
+    ap.add_argument("--suivi", type=Path)
+    ap.add_argument("--olu", type=Path)
+    ap.add_argument("--recueil", type=Path)
+    ap.add_argument("--plan", type=Path)
+    ap.add_argument("--budget", type=Path)
+    ap.add_argument("--annee", type=int, default=date.today().year)
+    ap.add_argument("--date", type=lambda s: date.fromisoformat(s), default=date.today())
+    args = ap.parse_args()
+
+    if args.rafraichir or not args.referentiel.exists():
+        Referentiel.charger().sauvegarder(args.referentiel)
+        logger.info("Instantané enregistré dans %s", args.referentiel)
+    ref = Referentiel.lire(args.referentiel)
+    avant = calculer(ref)
+
+    from . import (
+        import_budget_formation,
+        import_olu,
+        import_plan_formation,
+        import_recueil_besoins,
+        import_suivi_formations,
+    )
+
+    # Ordre d'exécution recommandé des imports
+    if args.suivi:
+        ref = appliquer_suivi(ref, _preparer(import_suivi_formations, args.suivi), args.date)
+    if args.olu:
+        ref = appliquer_olu(ref, _preparer(import_olu, args.olu))
+    if args.recueil:
+        ref = appliquer_recueil(ref, _preparer(import_recueil_besoins, args.recueil), args.annee)
+    if args.plan:
+        ref = appliquer_plan(ref, _preparer(import_plan_formation, args.plan), args.annee)
+    if args.budget:
+        ref = appliquer_budget(ref, _preparer(import_budget_formation, args.budget), args.annee)
+
+    for nom, diff in comparer(avant, calculer(ref)).items():
+        print(f"\n== {nom} ==")
+        print(diff.to_string() if len(diff) else "(inchangé)")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,18 @@ d'environnement pour éviter de coder en dur des données sensibles.
 from __future__ import annotations
 
 import configparser
+import datetime as dt
+import decimal
 import logging
 import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Iterable, Mapping
+from typing import Any, Iterable, Iterator, Mapping, Sequence
 
+import pandas as pd
 import pyodbc
 
 logger = logging.getLogger(__name__)
@@ -21,8 +28,34 @@ CONFIG_LOCATIONS = [
     Path(__file__).parent.parent / "config.ini",
 ]
 
+# Nombre de lignes demandées au serveur par fetchmany
+DEFAULT_ARRAY_SIZE = 5000
 
-def _load_config() -> configparser.SectionProxy:
+# type_code de cursor.description -> dtype pandas
+# pandas 2 accepte des unités autres que la nanoseconde, dont les bornes
+# (1677-2262) excluent les dates sentinelles de SQL Server (0001-01-01, 9999-12-31)
+_PANDAS_2 = int(pd.__version__.split(".")[0]) >= 2
+_DATETIME = "datetime64[us]" if _PANDAS_2 else "datetime64[ns]"
+
+_DTYPES: dict[type, str] = {
+    bool: "boolean",
+    int: "Int64",
+    float: "float64",
+    decimal.Decimal: "float64",
+    dt.datetime: _DATETIME,
+    dt.date: _DATETIME,
+    str: "string",
+}
+
+# Lignes examinées pour estimer la taille des paramètres d'un executemany / d'un lot lu
+SIZE_SAMPLE_ROWS = 1000
+
+
+# Cibles nommées : sections ``[sqlserver:<nom>]``, complétées par ``[sqlserver]``
+TARGET_PREFIX = "sqlserver:"
+
+
+def _read_config() -> configparser.ConfigParser:
     """Trouve et charge le premier fichier de configuration lisible.
 
     Priorité : variable d'env ``PLATFORM_HR_CONFIG`` > emplacements par défaut.
@@ -42,13 +75,38 @@ def _load_config() -> configparser.SectionProxy:
 
     parser = configparser.ConfigParser()
     parser.read(cfg_path, encoding="utf-8")
-    return parser["sqlserver"]
+    return parser
+
 
+def _load_config(target: str | None = None) -> configparser.SectionProxy:
+    """Section ``[sqlserver]``, ou ``[sqlserver:<target>]`` complétée par ``[sqlserver]``."""
+    parser = _read_config()
+    if target is None:
+        return parser["sqlserver"]
+    section = f"{TARGET_PREFIX}{target}"
+    if not parser.has_section(section):
+        raise KeyError(f"Cible inconnue dans la configuration: {target}")
+    if parser.has_section("sqlserver"):
+        for key, value in parser["sqlserver"].items():
+            parser[section].setdefault(key, value)
+    return parser[section]
 
-def get_connection(autocommit: bool = False) -> pyodbc.Connection:
-    """Retourne une nouvelle connexion pyodbc en utilisant le fichier de config/variables d'env."""
 
-    cfg = _load_config()
+def list_targets() -> list[str]:
+    """Noms des cibles ``[sqlserver:<nom>]`` déclarées dans la configuration."""
+    return [s[len(TARGET_PREFIX):] for s in _read_config().sections() if s.startswith(TARGET_PREFIX)]
+
+
+def get_connection(
+    autocommit: bool = False, target: str | None = None
+) -> pyodbc.Connection | InstrumentedConnection:
+    """Retourne une nouvelle connexion pyodbc en utilisant le fichier de config/variables d'env.
+
+    ``target`` désigne une cible nommée ``[sqlserver:<target>]`` (base d'une filiale, préproduction...).
+    Dans un bloc :func:`instrument`, la connexion retournée est instrumentée.
+    """
+
+    cfg = _load_config(target)
     driver = cfg.get("driver", "ODBC Driver 17 for SQL Server")
     trusted = cfg.getboolean("trusted_connection", fallback=False)
     
@@ -86,31 +144,355 @@ def get_connection(autocommit: bool = False) -> pyodbc.Connection:
     timeout = int(cfg.get("timeout", 30))
     logger.debug("Connexion à SQL Server %s/%s", cfg["server"], cfg["database"])
     logger.debug("Chaîne de connexion: %s", conn_str)
-    return pyodbc.connect(conn_str, timeout=timeout, autocommit=autocommit)
+    conn = pyodbc.connect(conn_str, timeout=timeout, autocommit=autocommit)
+    if _instrumentation is not None:
+        return InstrumentedConnection(conn, _instrumentation)
+    return conn
 
 
-def call_stored_procedure(
-    name: str, *params: Any, fetch: bool = False, **kw_params: Any
-) -> list[tuple] | None:
-    """Exécute une procédure stockée et (optionnellement) retourne le jeu de résultats.
+# -- instrumentation -------------------------------------------------------
 
-    Les paramètres positionnels viennent en premier, suivis des paramètres nommés (``@param=valeur``).
+
+def estimate_size(value: Any) -> int:
+    """Taille approximative d'une valeur liée, en octets (NVARCHAR en UTF-16)."""
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return 2 * len(value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, decimal.Decimal):
+        return 9
+    if isinstance(value, dt.datetime):
+        return 8
+    if isinstance(value, dt.date):
+        return 3
+    return 8
+
+
+def estimate_rows_size(rows: Sequence[Sequence[Any]]) -> int:
+    """Taille estimée d'un ensemble de lignes, extrapolée depuis les ``SIZE_SAMPLE_ROWS`` premières."""
+    if not rows:
+        return 0
+    sample = rows[:SIZE_SAMPLE_ROWS]
+    total = sum(estimate_size(v) for row in sample for v in row)
+    return total * len(rows) // len(sample)
+
+
+@dataclass
+class OperationStats:
+    calls: int = 0
+    rows: int = 0  # lignes de paramètres envoyées (lignes reçues pour ``fetch``)
+    bytes: int = 0  # estimation, voir estimate_size
+    fast_calls: int = 0  # appels faits avec ``fast_executemany`` demandé (et non prouvé effectif)
+    elapsed: float = 0.0
+
+
+@dataclass
+class Instrumentation:
+    """Compteurs par opération (``executemany``, ``EXEC``, ``execute``, ``fetch``) et messages serveur.
+
+    Partagée entre threads (pipeline, diffusion) : les mises à jour sont protégées par un verrou.
     """
+
+    operations: dict[str, OperationStats] = field(default_factory=dict)
+    messages: list[str] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, operation: str, rows: int, size: int, elapsed: float, fast: bool = False) -> None:
+        with self._lock:
+            stats = self.operations.setdefault(operation, OperationStats())
+            stats.calls += 1
+            stats.rows += rows
+            stats.bytes += size
+            stats.fast_calls += fast
+            stats.elapsed += elapsed
+
+    def capture_messages(self, cursor: pyodbc.Cursor) -> None:
+        """Messages informatifs du serveur (``PRINT``, avertissements) du dernier appel."""
+        messages = getattr(cursor, "messages", None)
+        if not messages:
+            return
+        with self._lock:
+            for _, text in messages:
+                logger.info("Serveur: %s", text)
+                self.messages.append(text)
+
+    def summary(self) -> str:
+        lines = [
+            f"{'opération':<12} {'appels':>7} {'lignes':>10} {'Mo estimés':>11} {'fast':>6} {'durée':>9}"
+        ]
+        for name, st in sorted(self.operations.items()):
+            lines.append(
+                f"{name:<12} {st.calls:>7} {st.rows:>10} {st.bytes / 1e6:>11.2f} {st.fast_calls:>6} {st.elapsed:>8.2f}s"
+            )
+        lines.append(f"{len(self.messages)} message(s) serveur")
+        return "\n".join(lines)
+
+    def log_summary(self, title: str) -> None:
+        logger.info("Accès base pour %s :\n%s", title, self.summary())
+
+
+class InstrumentedCursor:
+    """Curseur pyodbc dont les exécutions et lectures alimentent une :class:`Instrumentation`.
+
+    Pour ``executemany``, seul l'état demandé de ``fast_executemany`` est relevé :
+    le découpage en lots et les allers-retours réels dépendent du pilote et ne
+    sont pas observables d'ici.
+    """
+
+    def __init__(self, cursor: pyodbc.Cursor, instrumentation: Instrumentation):
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "_instrumentation", instrumentation)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._cursor, name, value)
+
+    def __enter__(self) -> "InstrumentedCursor":
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc: Any) -> Any:
+        return self._cursor.__exit__(*exc)
+
+    def __iter__(self) -> Iterator[pyodbc.Row]:
+        return iter(self.fetchone, None)
+
+    def execute(self, sql: str, *params: Any) -> "InstrumentedCursor":
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = tuple(params[0])
+        operation = "EXEC" if sql.lstrip()[:4].upper() == "EXEC" else "execute"
+        start = time.perf_counter()
+        self._cursor.execute(sql, *params)
+        elapsed = time.perf_counter() - start
+        self._instrumentation.record(operation, 1 if params else 0, estimate_rows_size([params]), elapsed)
+        self._instrumentation.capture_messages(self._cursor)
+        return self
+
+    def executemany(self, sql: str, seq_of_params: Iterable[Sequence[Any]]) -> None:
+        rows = seq_of_params if isinstance(seq_of_params, list) else list(seq_of_params)
+        start = time.perf_counter()
+        self._cursor.executemany(sql, rows)
+        elapsed = time.perf_counter() - start
+        self._instrumentation.record(
+            "executemany", len(rows), estimate_rows_size(rows), elapsed, fast=bool(self._cursor.fast_executemany)
+        )
+        self._instrumentation.capture_messages(self._cursor)
+
+    def _fetch(self, method: str, *args: Any) -> Any:
+        start = time.perf_counter()
+        result = getattr(self._cursor, method)(*args)
+        elapsed = time.perf_counter() - start
+        rows = [] if result is None else [result] if method == "fetchone" else result
+        self._instrumentation.record("fetch", len(rows), estimate_rows_size(rows), elapsed)
+        return result
+
+    def fetchone(self) -> pyodbc.Row | None:
+        return self._fetch("fetchone")
+
+    def fetchmany(self, size: int | None = None) -> list[pyodbc.Row]:
+        return self._fetch("fetchmany", *(() if size is None else (size,)))
+
+    def fetchall(self) -> list[pyodbc.Row]:
+        return self._fetch("fetchall")
+
+    def nextset(self) -> bool:
+        result = self._cursor.nextset()
+        self._instrumentation.capture_messages(self._cursor)
+        return result
+
+
+class InstrumentedConnection:
+    """Connexion pyodbc dont les curseurs sont des :class:`InstrumentedCursor`."""
+
+    def __init__(self, conn: pyodbc.Connection, instrumentation: Instrumentation):
+        self._conn = conn
+        self.instrumentation = instrumentation
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+    def __enter__(self) -> "InstrumentedConnection":
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc: Any) -> Any:
+        return self._conn.__exit__(*exc)
+
+    def cursor(self) -> InstrumentedCursor:
+        return InstrumentedCursor(self._conn.cursor(), self.instrumentation)
+
+
+_instrumentation: Instrumentation | None = None
+
+
+@contextmanager
+def instrument(title: str) -> Iterator[Instrumentation]:
+    """Instrumente toutes les connexions ouvertes par :func:`get_connection` dans le bloc.
+
+    Le résumé (appels, lignes, octets estimés, appels ``fast_executemany``, durée par opération) est
+    journalisé en sortie du bloc, y compris en cas d'erreur.
+    """
+    global _instrumentation
+    previous, _instrumentation = _instrumentation, Instrumentation()
+    current = _instrumentation
+    try:
+        yield current
+    finally:
+        _instrumentation = previous
+        current.log_summary(title)
+
+
+def _exec_sql(name: str, params: Sequence[Any], kw_params: Mapping[str, Any]) -> tuple[str, list[Any]]:
     placeholders: list[str] = []
     for _ in params:
         placeholders.append("?")
     for k in kw_params:
         placeholders.append(f"@{k}=?")
+    return f"EXEC {name} {', '.join(placeholders)}", list(params) + list(kw_params.values())
 
-    sql = f"EXEC {name} {', '.join(placeholders)}"
-    all_params: Iterable[Any] = list(params) + list(kw_params.values())
+
+def call_stored_procedure(
+    name: str, *params: Any, fetch: bool = False, **kw_params: Any
+) -> list[tuple] | None:
+    """Exécute une procédure stockée et (optionnellement) retourne le jeu de résultats.
+
+    Les paramètres positionnels viennent en premier, suivis des paramètres nommés (``@param=valeur``).
+    Seul le premier jeu de résultats est retourné, entièrement en mémoire : pour les
+    gros rapports ou les procédures à plusieurs jeux, utiliser :func:`stream_stored_procedure`.
+    """
+    with get_connection() as conn:
+        return call_stored_procedure_on(conn, name, *params, fetch=fetch, **kw_params)
+
+
+def call_stored_procedure_on(
+    conn: pyodbc.Connection, name: str, *params: Any, fetch: bool = False, **kw_params: Any
+) -> list[tuple] | None:
+    """Comme :func:`call_stored_procedure`, sur une connexion existante (sans commit).
+
+    Le curseur est fermé explicitement : ``with conn.cursor()`` validerait la
+    transaction en sortie, alors qu'elle appartient à l'appelant.
+    """
+    sql, all_params = _exec_sql(name, params, kw_params)
+
+    cursor = conn.cursor()
+    try:
+        logger.info("EXEC %s", name)
+        cursor.execute(sql, *all_params)
+        if fetch:
+            rows = cursor.fetchall()
+            logger.debug("Fetched %d rows from %s", len(rows), name)
+            return rows
+        return None
+    finally:
+        cursor.close()
+
+
+def iter_result_sets(cursor: pyodbc.Cursor) -> Iterator[int]:
+    """Positionne ``cursor`` sur chaque jeu de résultats successif (``nextset()``).
+
+    Les instructions sans colonnes (comptes de lignes, affectations) sont ignorées.
+    Les lignes non consommées d'un jeu sont abandonnées au passage au suivant.
+    """
+    index = 0
+    while True:
+        if cursor.description is not None:
+            yield index
+            index += 1
+        if not cursor.nextset():
+            return
+
+
+def iter_batches(cursor: pyodbc.Cursor, array_size: int = DEFAULT_ARRAY_SIZE) -> Iterator[list[pyodbc.Row]]:
+    """Lots de ``fetchmany`` du jeu de résultats courant."""
+    cursor.arraysize = array_size
+    while True:
+        rows = cursor.fetchmany(array_size)
+        if not rows:
+            return
+        yield rows
+
+
+def iter_rows(cursor: pyodbc.Cursor, array_size: int = DEFAULT_ARRAY_SIZE) -> Iterator[pyodbc.Row]:
+    """Lignes du jeu de résultats courant, lues par lots de ``array_size``."""
+    for rows in iter_batches(cursor, array_size):
+        yield from rows
+
+
+def description_dtypes(description: Sequence[tuple]) -> dict[str, str]:
+    """dtypes pandas déduits de ``cursor.description`` (``object`` si type inconnu)."""
+    return {col[0]: _DTYPES.get(col[1], "object") for col in description}
+
+
+def rows_to_dataframe(rows: Sequence[Sequence[Any]], description: Sequence[tuple]) -> pd.DataFrame:
+    """Convertit un lot de lignes pyodbc en DataFrame typé."""
+    dtypes = description_dtypes(description)
+    df = pd.DataFrame.from_records([tuple(r) for r in rows], columns=list(dtypes))
+    for col, dtype in dtypes.items():
+        if dtype.startswith("datetime"):
+            # Conversion directe dans l'unité déclarée : pd.to_datetime choisirait l'unité
+            # selon les données, ou passerait par la nanoseconde avant pandas 3
+            df[col] = pd.Series(df[col].to_numpy(dtype=dtype), index=df.index)
+        elif dtype != "object":
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def stream_stored_procedure(
+    name: str,
+    *params: Any,
+    array_size: int = DEFAULT_ARRAY_SIZE,
+    as_dataframe: bool = False,
+    **kw_params: Any,
+) -> Iterator[tuple[int, list[pyodbc.Row] | pd.DataFrame]]:
+    """Exécute une procédure et produit ``(numéro du jeu, lot)`` pour tous ses jeux de résultats.
+
+    Chaque lot contient au plus ``array_size`` lignes, en ``Row`` pyodbc ou en
+    DataFrame typé si ``as_dataframe``. La connexion reste ouverte tant que le
+    générateur n'est pas épuisé ou fermé.
+    """
+    sql, all_params = _exec_sql(name, params, kw_params)
+
+    # Fermeture explicite : le générateur peut être abandonné avant la fin.
+    conn = get_connection(autocommit=True)
+    try:
+        cursor = conn.cursor()
+        logger.info("EXEC %s (streaming)", name)
+        cursor.execute(sql, *all_params)
+        for index in iter_result_sets(cursor):
+            description = cursor.description
+            count = 0
+            for rows in iter_batches(cursor, array_size):
+                count += len(rows)
+                yield index, rows_to_dataframe(rows, description) if as_dataframe else rows
+            logger.debug("Streamed %d rows from %s (result set %d)", count, name, index)
+    finally:
+        conn.close()
+
+
+def fetch_dataframes(
+    name: str, *params: Any, array_size: int = DEFAULT_ARRAY_SIZE, **kw_params: Any
+) -> list[pd.DataFrame]:
+    """Tous les jeux de résultats d'une procédure, un DataFrame typé par jeu.
+
+    Les jeux vides sont conservés (DataFrame sans ligne mais avec ses colonnes).
+    """
+    sql, all_params = _exec_sql(name, params, kw_params)
 
     with get_connection() as conn:
         with conn.cursor() as cursor:
             logger.info("EXEC %s", name)
             cursor.execute(sql, *all_params)
-            if fetch:
-                rows = cursor.fetchall()
-                logger.debug("Fetched %d rows from %s", len(rows), name)
-                return rows
-            return None
+            frames = []
+            for _ in iter_result_sets(cursor):
+                description = cursor.description
+                batches = [rows_to_dataframe(rows, description) for rows in iter_batches(cursor, array_size)]
+                frames.append(
+                    pd.concat(batches, ignore_index=True) if batches else rows_to_dataframe([], description)
+                )
+            return frames
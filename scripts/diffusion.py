@@ -0,0 +1,117 @@
+"""Import diffusé vers plusieurs bases cibles en parallèle.
+
+Le fichier est lu, contrôlé et nettoyé une seule fois ; le DataFrame obtenu est
+ensuite chargé dans chaque cible nommée (sections ``[sqlserver:<nom>]`` du
+fichier de configuration) par un thread dédié, avec sa propre connexion et sa
+propre transaction : ``charger_temp`` puis la procédure ``sp_Importer*``, puis
+commit. Une cible en échec est annulée (rollback) sans affecter les autres.
+
+Les paramètres d'insertion sont construits une seule fois, avant la diffusion :
+les threads ne font que les envoyer, et pyodbc libère le GIL pendant les
+échanges réseau. La durée totale reste proche de celle de la cible la plus
+lente, quel que soit le nombre de cibles.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Sequence
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ResultatCible:
+    cible: str
+    succes: bool
+    duree: float
+    erreur: str | None = None
+
+
+def _importer_cible(
+    cible: str, charger: Callable[[Any], None], procedure: str, params: Sequence[Any]
+) -> ResultatCible:
+    debut = time.perf_counter()
+    try:
+        conn = db.get_connection(target=cible)
+    except Exception as exc:
+        return ResultatCible(cible, False, time.perf_counter() - debut, f"connexion: {exc}")
+    try:
+        charger(conn)
+        db.call_stored_procedure_on(conn, procedure, *params)
+        conn.commit()
+        return ResultatCible(cible, True, time.perf_counter() - debut)
+    except Exception as exc:
+        logger.exception("Cible %s: import annulé", cible)
+        try:
+            conn.rollback()
+        except Exception:
+            # Connexion perdue : le serveur annule de lui-même la transaction ouverte
+            logger.warning("Cible %s: rollback impossible", cible, exc_info=True)
+        return ResultatCible(cible, False, time.perf_counter() - debut, str(exc))
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            logger.warning("Cible %s: fermeture de la connexion impossible", cible, exc_info=True)
+
+
+def diffuser(
+    cibles: Sequence[str],
+    charger: Callable[[Any], None],
+    procedure: str,
+    *params: Any,
+) -> list[ResultatCible]:
+    """Exécute ``charger(conn)`` puis ``procedure(*params)`` sur chaque cible, en parallèle.
+
+    ``charger`` reçoit la connexion de la cible et n'envoie que des paramètres
+    préparés une fois pour toutes dans le thread appelant (typiquement
+    ``lambda conn: inserer_temp(conn, lignes)`` avec ``lignes = lignes_temp(df)``) :
+    tout travail Python fait dans ``charger`` garde le GIL et s'exécute une cible
+    après l'autre.
+    Les résultats sont retournés dans l'ordre de ``cibles``.
+    """
+    inconnues = set(cibles) - set(db.list_targets())
+    if inconnues:
+        raise KeyError(f"Cibles inconnues dans la configuration: {', '.join(sorted(inconnues))}")
+
+    debut = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(cibles), thread_name_prefix="diffusion") as executeur:
+        resultats = list(executeur.map(lambda c: _importer_cible(c, charger, procedure, params), cibles))
+    duree = time.perf_counter() - debut
+
+    for r in resultats:
+        if r.succes:
+            logger.info("Cible %-20s OK     %6.2f s", r.cible, r.duree)
+        else:
+            logger.error("Cible %-20s ÉCHEC  %6.2f s  %s", r.cible, r.duree, r.erreur)
+    logger.info(
+        "Diffusion: %d/%d cibles importées en %.2f s (cible la plus lente: %.2f s)",
+        sum(r.succes for r in resultats),
+        len(resultats),
+        duree,
+        max(r.duree for r in resultats),
+    )
+    return resultats
+
+
+def verifier(resultats: Sequence[ResultatCible]) -> None:
+    """Lève ``RuntimeError`` si au moins une cible a échoué."""
+    echecs = [r.cible for r in resultats if not r.succes]
+    if echecs:
+        raise RuntimeError(f"Import en échec pour: {', '.join(echecs)}")
+
+
+def ajouter_arguments(ap: argparse.ArgumentParser) -> None:
+    """Option commune aux scripts d'import pour la diffusion multi-cibles."""
+    ap.add_argument(
+        "--cibles",
+        nargs="+",
+        metavar="NOM",
+        help="Cibles [sqlserver:NOM] à alimenter en parallèle (fichier lu et nettoyé une seule fois)",
+    )
@@ -0,0 +1,262 @@
+"""Export en flux des vues ``vw_*`` et des procédures de reporting vers Parquet ou CSV.
+
+Seules les sources de la liste blanche ci-dessous sont exportables : les
+requêtes sont des constantes, jamais construites à partir des arguments.
+Les lignes sont lues par lots (``fetchmany``), converties en colonnes typées
+Arrow d'après ``cursor.description`` puis écrites immédiatement : la mémoire
+reste constante quelle que soit la taille de l'export. Toutes les sources
+d'une même commande partagent une seule connexion.
+
+Usage :
+    python -m scripts.export vw_Suivi_Budget vw_Plan_Formation_Budget --dest exports
+    python -m scripts.export vw_Formations_Par_Collaborateur --format csv --partition departement
+    python -m scripts.export sp_RapportBudgetFormation --param annee=2025
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import decimal
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Sequence
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from . import db
+
+logger = logging.getLogger("export")
+
+TAILLE_LOT = 10_000
+PARTITION_NULLE = "__HIVE_DEFAULT_PARTITION__"
+
+VUES = [
+    "vw_Formations_Par_Collaborateur",
+    "vw_Plan_Formation_Budget",
+    "vw_KPI_Formation_Departement",
+    "vw_Suivi_Budget",
+    "vw_Demandes_En_Attente",
+    "vw_KPI_Global",
+    "vw_Top10_Formations",
+    "vw_Taux_Realisation_Plan",
+    "vw_Repartition_Categorie",
+    "vw_Formations_Departement",
+    "vw_Formations_Manager",
+    "vw_Comparaison_Sources",
+    "vw_Evolution_Mensuelle",
+    "vw_Taux_Formation_Genre",
+    "vw_Taux_Formation_Contrat",
+]
+
+# Procédure -> paramètres attendus (dans l'ordre)
+PROCEDURES: dict[str, list[str]] = {
+    "sp_RapportFormationCollaborateur": ["id_collaborateur"],
+    "sp_RapportFormationDepartement": ["departement"],
+    "sp_RapportBudgetFormation": ["annee"],
+    "sp_TableauDeBord": [],
+}
+
+SOURCES: dict[str, str] = {
+    **{vue: f"SELECT * FROM {vue}" for vue in VUES},
+    **{
+        proc: f"EXEC {proc} " + ", ".join(f"@{p}=?" for p in params)
+        for proc, params in PROCEDURES.items()
+    },
+}
+
+
+def type_arrow(colonne: tuple) -> pa.DataType:
+    """Type Arrow d'une colonne de ``cursor.description`` (nom, type_code, ..., précision, échelle, ...)."""
+    type_code, precision, echelle = colonne[1], colonne[4], colonne[5]
+    if type_code is bool:
+        return pa.bool_()
+    if type_code is int:
+        return pa.int64()
+    if type_code is float:
+        return pa.float64()
+    if type_code is decimal.Decimal:
+        if precision and 0 < precision <= 38:
+            return pa.decimal128(precision, echelle or 0)
+        return pa.float64()
+    if type_code is dt.datetime:
+        return pa.timestamp("us")
+    if type_code is dt.date:
+        return pa.date32()
+    if type_code is dt.time:
+        return pa.time64("us")
+    if type_code in (bytes, bytearray):
+        return pa.binary()
+    return pa.string()
+
+
+def schema_arrow(description: Sequence[tuple]) -> pa.Schema:
+    return pa.schema([pa.field(col[0], type_arrow(col)) for col in description])
+
+
+def lot_arrow(rows: Sequence[Sequence[Any]], schema: pa.Schema) -> pa.RecordBatch:
+    """Transpose un lot de lignes pyodbc en colonnes Arrow typées."""
+    colonnes = list(zip(*rows)) if rows else [()] * len(schema)
+    tableaux = []
+    for valeurs, champ in zip(colonnes, schema):
+        if pa.types.is_string(champ.type):
+            valeurs = [v if v is None or isinstance(v, str) else str(v) for v in valeurs]
+        tableaux.append(pa.array(valeurs, type=champ.type))
+    return pa.RecordBatch.from_arrays(tableaux, schema=schema)
+
+
+class Ecrivains:
+    """Un fichier ouvert par partition ; chaque lot est ajouté sans relecture.
+
+    Comme dans la convention Hive, la colonne de partition n'est portée que par
+    le nom du dossier (``annee=2025``), pas par les fichiers. La valeur y est
+    encodée comme une URL (``RH/Paie`` → ``departement=RH%2FPaie``), ce que les
+    lecteurs Hive/pyarrow décodent.
+    """
+
+    def __init__(self, dossier: Path, schema: pa.Schema, format: str, partition: str | None):
+        if partition is not None and partition not in schema.names:
+            raise ValueError(f"Colonne de partition inconnue: {partition}")
+        self.dossier = dossier
+        self.schema = schema if partition is None else schema.remove(schema.get_field_index(partition))
+        self.format = format
+        self.partition = partition
+        self.ouverts: dict[str | None, Any] = {}
+
+    def _ecrivain(self, valeur: str | None):
+        if valeur not in self.ouverts:
+            dossier = self.dossier
+            if self.partition is not None:
+                dossier = dossier / f"{self.partition}={quote(valeur, safe='')}"
+            dossier.mkdir(parents=True, exist_ok=True)
+            if self.format == "parquet":
+                self.ouverts[valeur] = pq.ParquetWriter(dossier / "part-0.parquet", self.schema)
+            else:
+                self.ouverts[valeur] = pa_csv.CSVWriter(dossier / "part-0.csv", self.schema)
+        return self.ouverts[valeur]
+
+    def ecrire(self, lot: pa.RecordBatch) -> None:
+        if self.partition is None:
+            self._ecrivain(None).write_batch(lot)
+            return
+        table = pa.Table.from_batches([lot])
+        colonne = table[self.partition]
+        table = table.drop_columns([self.partition])
+        nuls = pc.is_null(colonne)
+        if pc.any(nuls).as_py():
+            self._ecrivain(PARTITION_NULLE).write_table(table.filter(nuls))
+        for valeur in pc.unique(colonne.drop_null()).to_pylist():
+            self._ecrivain(str(valeur)).write_table(table.filter(pc.equal(colonne, valeur)))
+
+    def fermer(self) -> None:
+        for ecrivain in self.ouverts.values():
+            ecrivain.close()
+        self.ouverts.clear()
+
+
+@dataclass
+class StatsExport:
+    source: str
+    lignes: int = 0
+    lots: int = 0
+    duree: float = 0.0
+
+    @property
+    def debit(self) -> float:
+        return self.lignes / self.duree if self.duree else 0.0
+
+
+def exporter_curseur(
+    cursor,
+    dossier: Path,
+    format: str = "parquet",
+    taille_lot: int = TAILLE_LOT,
+    partition: str | None = None,
+) -> StatsExport:
+    """Écrit le jeu de résultats courant de ``cursor`` lot par lot."""
+    stats = StatsExport(dossier.name)
+    debut = time.perf_counter()
+    schema = schema_arrow(cursor.description)
+    ecrivains = Ecrivains(dossier, schema, format, partition)
+    try:
+        for rows in db.iter_batches(cursor, taille_lot):
+            ecrivains.ecrire(lot_arrow(rows, schema))
+            stats.lignes += len(rows)
+            stats.lots += 1
+        if not ecrivains.ouverts and partition is None:
+            # Source vide : un fichier avec le schéma seul
+            ecrivains.ecrire(lot_arrow([], schema))
+    finally:
+        ecrivains.fermer()
+    stats.duree = time.perf_counter() - debut
+    return stats
+
+
+def exporter(
+    conn,
+    source: str,
+    dest: Path,
+    params: dict[str, str] | None = None,
+    format: str = "parquet",
+    taille_lot: int = TAILLE_LOT,
+    partition: str | None = None,
+) -> list[StatsExport]:
+    """Exporte une source de la liste blanche ; une procédure produit un dossier par jeu de résultats."""
+    if source not in SOURCES:
+        raise ValueError(f"Source non autorisée: {source}")
+    params = params or {}
+    attendus = PROCEDURES.get(source, [])
+    manquants = [p for p in attendus if p not in params]
+    if manquants:
+        raise ValueError(f"Paramètres manquants pour {source}: {', '.join(manquants)}")
+
+    cursor = conn.cursor()
+    try:
+        logger.info("Export %s", source)
+        cursor.execute(SOURCES[source], *[params[p] for p in attendus])
+
+        resultats = []
+        for jeu in db.iter_result_sets(cursor):
+            dossier = dest / source if source in VUES else dest / source / f"jeu_{jeu}"
+            # La colonne de partition n'existe pas forcément dans tous les jeux d'une procédure.
+            cols = [c[0] for c in cursor.description]
+            stats = exporter_curseur(cursor, dossier, format, taille_lot, partition if partition in cols else None)
+            logger.info("%s: %d lignes en %.2f s (%.0f lignes/s)", dossier, stats.lignes, stats.duree, stats.debit)
+            resultats.append(stats)
+    finally:
+        cursor.close()
+    return resultats
+
+
+def _param(texte: str) -> tuple[str, str]:
+    cle, _, valeur = texte.partition("=")
+    if not valeur:
+        raise argparse.ArgumentTypeError("Format attendu: nom=valeur")
+    return cle, valeur
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    ap = argparse.ArgumentParser(description="Export des vues et rapports GestionFormation")
+    ap.add_argument("sources", nargs="+", choices=sorted(SOURCES), metavar="SOURCE")
+    ap.add_argument("--dest", type=Path, default=Path("exports"))
+    ap.add_argument("--format", choices=["parquet", "csv"], default="parquet")
+    ap.add_argument("--taille-lot", type=int, default=TAILLE_LOT)
+    ap.add_argument("--partition", help="Colonne de partitionnement (ex. annee, departement)")
+    ap.add_argument("--param", type=_param, action="append", default=[], help="Paramètre de procédure nom=valeur")
+    args = ap.parse_args()
+
+    with db.get_connection(autocommit=True) as conn:
+        for source in args.sources:
+            exporter(conn, source, args.dest, dict(args.param), args.format, args.taille_lot, args.partition)
+
+    logger.info("Export terminé")
+
+
+if __name__ == "__main__":
+    main()
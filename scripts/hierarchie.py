@@ -0,0 +1,189 @@
+"""Index hiérarchique des collaborateurs (arbre ``Collaborateurs.id_manager``).
+
+Les paires (collaborateur, manager) sont lues une seule fois via
+``sp_ListerHierarchie`` puis indexées par parcours en profondeur (intervalles
+d'Euler) : chaque collaborateur reçoit une position ``entree`` dans l'ordre
+préfixe et ``sortie = entree + taille du sous-arbre``. L'équipe complète d'un
+manager est alors la tranche ``[entree + 1, sortie)`` et un cumul sur toute son
+organisation est une différence de deux sommes préfixes, en O(1).
+
+Les anomalies sont détectées à la construction :
+
+* cycles (A manage B qui manage A) : rompus en promouvant un membre en racine ;
+* orphelins : ``id_manager`` qui ne correspond à aucun collaborateur ;
+* managers fictifs ``MGR_...`` créés par ``sp_ImporterDonneesOLU``.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PREFIXE_MANAGER_FICTIF = "MGR_"
+
+
+class IndexHierarchie:
+    def __init__(self, paires: Iterable[tuple[str, str | None]]):
+        collaborateurs, managers = [], []
+        for id_collaborateur, id_manager in paires:
+            collaborateurs.append(id_collaborateur)
+            managers.append(None if pd.isna(id_manager) or id_manager == "" else id_manager)
+
+        self.ids = np.asarray(collaborateurs, dtype=object)
+        self.position = {c: i for i, c in enumerate(collaborateurs)}
+        if len(self.position) != len(collaborateurs):
+            raise ValueError("Identifiants collaborateurs en double")
+        n = len(collaborateurs)
+
+        parent = np.fromiter(
+            (self.position.get(m, -1) if m is not None else -1 for m in managers),
+            dtype=np.int64,
+            count=n,
+        )
+        self.orphelins = [
+            c for c, m in zip(collaborateurs, managers) if m is not None and m not in self.position
+        ]
+        self.managers_fictifs = [c for c in collaborateurs if str(c).startswith(PREFIXE_MANAGER_FICTIF)]
+        self.cycles: list[list[str]] = []
+
+        self.parent = parent
+        self.entree = np.full(n, -1, dtype=np.int64)
+        self.sortie = np.full(n, -1, dtype=np.int64)
+        self.ordre = np.empty(n, dtype=np.int64)  # ordre[entree[i]] == i
+        self._construire()
+
+        if self.orphelins:
+            logger.warning("%d collaborateurs ont un manager inconnu", len(self.orphelins))
+        if self.managers_fictifs:
+            logger.warning("%d managers fictifs (%s...)", len(self.managers_fictifs), PREFIXE_MANAGER_FICTIF)
+        if self.cycles:
+            logger.warning("%d cycles hiérarchiques rompus", len(self.cycles))
+
+    @classmethod
+    def charger(cls) -> "IndexHierarchie":
+        """Construit l'index depuis la base (un seul appel à ``sp_ListerHierarchie``)."""
+        from . import db
+
+        (paires,) = db.fetch_dataframes("sp_ListerHierarchie")
+        return cls(paires[["id_collaborateur", "id_manager"]].itertuples(index=False))
+
+    # -- construction -----------------------------------------------------
+
+    def _enfants(self) -> tuple[np.ndarray, np.ndarray]:
+        """Listes d'enfants au format CSR : ``enfants[debut[p]:debut[p + 1]]``."""
+        n = len(self.ids)
+        avec_parent = np.flatnonzero(self.parent >= 0)
+        enfants = avec_parent[np.argsort(self.parent[avec_parent], kind="stable")]
+        debut = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.parent[avec_parent], minlength=n), out=debut[1:])
+        return enfants, debut
+
+    def _construire(self) -> None:
+        n = len(self.ids)
+        t = 0
+        racines = list(np.flatnonzero(self.parent < 0))
+        while True:
+            enfants, debut = self._enfants()
+            for racine in racines:
+                pile = [racine]
+                while pile:
+                    v = pile.pop()
+                    self.entree[v] = t
+                    self.ordre[t] = v
+                    t += 1
+                    # ordre inverse pour visiter les enfants dans l'ordre d'origine
+                    pile.extend(enfants[debut[v] : debut[v + 1]][::-1])
+            if t == n:
+                break
+            # Noeuds non atteints : ils sont dans un cycle ou suspendus sous un cycle.
+            racines = [self._rompre_cycle(int(np.flatnonzero(self.entree < 0)[0]))]
+
+        taille = np.ones(n, dtype=np.int64)
+        for v in self.ordre[::-1]:
+            p = self.parent[v]
+            if p >= 0:
+                taille[p] += taille[v]
+        self.sortie = self.entree + taille
+
+    def _rompre_cycle(self, depart: int) -> int:
+        vus: dict[int, int] = {}
+        v = depart
+        while v not in vus:
+            vus[v] = len(vus)
+            v = int(self.parent[v])
+        cycle = [u for u, rang in sorted(vus.items(), key=lambda kv: kv[1]) if rang >= vus[v]]
+        self.cycles.append([self.ids[u] for u in cycle])
+        self.parent[v] = -1
+        return v
+
+    # -- requêtes ---------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, id_collaborateur: str) -> bool:
+        return id_collaborateur in self.position
+
+    def taille_equipe(self, id_manager: str) -> int:
+        """Nombre de collaborateurs (directs et indirects) sous ``id_manager``."""
+        i = self.position[id_manager]
+        return int(self.sortie[i] - self.entree[i] - 1)
+
+    def est_sous(self, id_collaborateur: str, id_manager: str) -> bool:
+        """Vrai si ``id_collaborateur`` appartient à l'organisation de ``id_manager``."""
+        c, m = self.position[id_collaborateur], self.position[id_manager]
+        return bool(self.entree[m] < self.entree[c] < self.sortie[m])
+
+    def subordonnes(self, id_manager: str) -> np.ndarray:
+        """Tous les collaborateurs sous ``id_manager``, dans l'ordre du parcours."""
+        i = self.position[id_manager]
+        return self.ids[self.ordre[self.entree[i] + 1 : self.sortie[i]]]
+
+    def directs(self, id_manager: str) -> np.ndarray:
+        return self.ids[self.parent == self.position[id_manager]]
+
+    def cumuler(self, valeurs: pd.DataFrame, inclure_manager: bool = False) -> pd.DataFrame:
+        """Cumule des colonnes numériques sur l'organisation complète de chaque collaborateur.
+
+        ``valeurs`` est indexé par ``id_collaborateur`` ; les absents comptent pour 0.
+        Le résultat est indexé comme l'index hiérarchique et se consulte en O(1).
+        """
+        colonnes = valeurs.select_dtypes("number").columns
+        matrice = (
+            valeurs[colonnes].groupby(level=0).sum().reindex(self.ids[self.ordre], fill_value=0).to_numpy(float)
+        )
+        prefixes = np.zeros((len(self.ids) + 1, len(colonnes)))
+        np.cumsum(matrice, axis=0, out=prefixes[1:])
+        debut = self.entree if inclure_manager else self.entree + 1
+        cumuls = prefixes[self.sortie] - prefixes[debut]
+        return pd.DataFrame(cumuls, index=pd.Index(self.ids, name="id_collaborateur"), columns=colonnes)
+
+
+def indicateurs_formation(
+    index: IndexHierarchie, inscriptions: pd.DataFrame, inclure_manager: bool = False
+) -> pd.DataFrame:
+    """Heures et taux de réalisation cumulés sur l'organisation de chaque manager.
+
+    ``inscriptions`` reprend les colonnes de ``vw_Formations_Par_Collaborateur``
+    (``id_collaborateur``, ``statut``, ``duree_reelle``).
+    """
+    termine = inscriptions["statut"].eq("Terminé")
+    par_collaborateur = pd.DataFrame(
+        {
+            "nombre_inscriptions": 1,
+            "nombre_termines": termine.astype(int),
+            "heures_formation": pd.to_numeric(inscriptions["duree_reelle"], errors="coerce")
+            .fillna(0)
+            .where(termine, 0.0),
+        }
+    ).set_index(inscriptions["id_collaborateur"])
+    cumuls = index.cumuler(par_collaborateur, inclure_manager=inclure_manager)
+    cumuls["nombre_collaborateurs"] = index.sortie - index.entree - (0 if inclure_manager else 1)
+    cumuls["taux_realisation"] = (
+        cumuls["nombre_termines"] / cumuls["nombre_inscriptions"].where(cumuls["nombre_inscriptions"] > 0)
+    )
+    return cumuls
@@ -9,7 +9,7 @@ from pathlib import Path
 
 import pandas as pd
 
-from . import db
+from . import db, diffusion, pipeline, validation
 
 logger = logging.getLogger("import_budget")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -36,6 +36,12 @@ COL_MAP = {
     "Commentaires": "commentaires",
 }
 
+REGLES = validation.Regles(
+    requises=["NOM FORMATION", "BUDGET"],
+    numeriques=["TARIF HT", "BUDGET", "SEMESTRE DE VALIDATION"],
+    bornes={"SEMESTRE DE VALIDATION": (1, 2)},
+)
+
 INSERT_SQL = (
     "INSERT INTO #TempBudget (organisme_formation, nom_formation, dates, tarif_ht, budget, "
     "semestre_validation, employes, commentaires) VALUES (?,?,?,?,?,?,?,?)"
@@ -60,41 +66,76 @@ def nettoyer(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def charger_temp(conn, df: pd.DataFrame):
-    df_sql = df.rename(columns=COL_MAP)
-    records = df_sql.to_dict("records")
+def lignes_temp(df: pd.DataFrame) -> list[tuple]:
+    """Paramètres d'insertion dans #TempBudget, dans l'ordre de ``INSERT_SQL``."""
+    records = df.rename(columns=COL_MAP).to_dict("records")
+    return [
+        (
+            r["organisme_formation"],
+            r["nom_formation"],
+            r["dates"],
+            r["tarif_ht"],
+            r["budget"],
+            r["semestre_validation"],
+            r["employes"],
+            r["commentaires"],
+        )
+        for r in records
+    ]
+
+
+def inserer_temp(conn, lignes: list[tuple]):
     cur = conn.cursor()
     cur.fast_executemany = True
-    cur.executemany(
-        INSERT_SQL,
-        [
-            (
-                r["organisme_formation"],
-                r["nom_formation"],
-                r["dates"],
-                r["tarif_ht"],
-                r["budget"],
-                r["semestre_validation"],
-                r["employes"],
-                r["commentaires"],
-            )
-            for r in records
-        ],
-    )
-    logger.info("Inséré %d lignes dans #TempBudget", len(records))
+    cur.executemany(INSERT_SQL, lignes)
+    logger.info("Inséré %d lignes dans #TempBudget", len(lignes))
+
+
+def charger_temp(conn, df: pd.DataFrame):
+    inserer_temp(conn, lignes_temp(df))
 
 
 def main():
     ap = argparse.ArgumentParser(description="Import Budget Formation")
     ap.add_argument("excel", type=Path)
     ap.add_argument("--annee", type=int, required=True)
+    validation.ajouter_arguments(ap)
+    pipeline.ajouter_arguments(ap)
+    diffusion.ajouter_arguments(ap)
     args = ap.parse_args()
-
-    df = nettoyer(lire_excel(args.excel))
-
-    with db.get_connection() as conn:
-        charger_temp(conn, df)
-        db.call_stored_procedure("sp_ImporterBudgetFormation", args.annee)
+    if args.pipeline and args.cibles:
+        ap.error("--pipeline et --cibles sont incompatibles")
+
+    if not args.pipeline:
+        df = validation.controler(
+            lire_excel(args.excel), REGLES, args.excel, args.quarantaine, args.taux_rejet_max
+        )
+        df = nettoyer(df)
+
+    with db.instrument("Import Budget"):
+        if args.cibles:
+            # Paramètres construits une seule fois : seul l'envoi tourne dans les threads
+            lignes = lignes_temp(df)
+            resultats = diffusion.diffuser(
+                args.cibles, lambda conn: inserer_temp(conn, lignes), "sp_ImporterBudgetFormation", args.annee
+            )
+            diffusion.verifier(resultats)
+        else:
+            with db.get_connection() as conn:
+                if args.pipeline:
+                    pipeline.importer_excel(
+                        args.excel,
+                        EXPECTED_COLS,
+                        REGLES,
+                        nettoyer,
+                        lambda bloc: charger_temp(conn, bloc),
+                        taille_bloc=args.taille_bloc,
+                        fichier_quarantaine=args.quarantaine,
+                        taux_rejet_max=args.taux_rejet_max,
+                    )
+                else:
+                    charger_temp(conn, df)
+                db.call_stored_procedure("sp_ImporterBudgetFormation", args.annee)
 
     logger.info("Import Budget terminé")
 
@@ -16,7 +16,7 @@ from pathlib import Path
 
 import pandas as pd
 
-from . import db
+from . import agregats, db, diffusion, pipeline, validation
 
 logger = logging.getLogger("import_olu")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -35,6 +35,36 @@ EXPECTED_COLS = [
     "Récapitulatif - Assigné par",
 ]
 
+COL_MAP = {
+    "Utilisateur - ID d'utilisateur": "id_utilisateur",
+    "Utilisateur - Sexe de l'utilisateur": "sexe_utilisateur",
+    "Utilisateur - Manager - Nom complet": "manager_nom",
+    "Formation - Titre de la formation": "titre_formation",
+    "Récapitulatif - Statut": "statut",
+    "Récapitulatif - Date d'inscription": "date_inscription",
+    "Récapitulatif - Date d'achèvement": "date_achevement",
+    "Formation - Heures de formation": "heures_formation",
+    "Formation - Type de formation": "type_formation",
+    "Récapitulatif - Assigné par": "assigne_par",
+}
+
+REGLES = validation.Regles(
+    requises=[
+        "Utilisateur - ID d'utilisateur",
+        "Formation - Titre de la formation",
+        "Récapitulatif - Statut",
+        "Récapitulatif - Date d'inscription",
+    ],
+    numeriques=["Formation - Heures de formation"],
+    dates=["Récapitulatif - Date d'inscription", "Récapitulatif - Date d'achèvement"],
+)
+
+INSERT_SQL = (
+    "INSERT INTO #TempOLU (id_utilisateur, sexe_utilisateur, manager_nom, titre_formation, "
+    "statut, date_inscription, date_achevement, heures_formation, type_formation, assigne_par) "
+    "VALUES (?,?,?,?,?,?,?,?,?,?)"
+)
+
 
 def lire_excel(path: Path) -> pd.DataFrame:
     df = pd.read_excel(path, dtype=str)
@@ -50,21 +80,12 @@ def lire_excel(path: Path) -> pd.DataFrame:
 def nettoyer(df: pd.DataFrame) -> pd.DataFrame:
     """Nettoyage minimal - la procédure stockée fait le gros du travail, mais conversion des dates et nombres."""
     df = df.copy()
-
-    def parse_date(s):
-        if pd.isna(s):
-            return None
-        try:
-            return pd.to_datetime(s, dayfirst=False, errors="coerce").date()
-        except Exception:
-            return None
-
-    df["Récapitulatif - Date d'inscription"] = df[
-        "Récapitulatif - Date d'inscription"
-    ].apply(parse_date)
-    df["Récapitulatif - Date d'achèvement"] = df[
-        "Récapitulatif - Date d'achèvement"
-    ].apply(parse_date)
+    df["Récapitulatif - Date d'inscription"] = validation.vers_dates_python(
+        df["Récapitulatif - Date d'inscription"]
+    )
+    df["Récapitulatif - Date d'achèvement"] = validation.vers_dates_python(
+        df["Récapitulatif - Date d'achèvement"]
+    )
 
     # Heures formation -> float
     df["Formation - Heures de formation"] = pd.to_numeric(
@@ -73,50 +94,39 @@ def nettoyer(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def charger_temp(conn, df: pd.DataFrame):
-    """Insère le dataframe dans la table temporaire attendue par la procédure stockée.
-
-    Nous utilisons fast executemany avec .to_records pour les performances.
+def lignes_temp(df: pd.DataFrame) -> list[tuple]:
+    """Paramètres d'insertion dans #TempOLU, dans l'ordre de ``INSERT_SQL``."""
+    records = df.rename(columns=COL_MAP).to_dict("records")
+    return [
+        (
+            r["id_utilisateur"],
+            r["sexe_utilisateur"],
+            r["manager_nom"],
+            r["titre_formation"],
+            r["statut"],
+            r["date_inscription"],
+            r["date_achevement"],
+            r["heures_formation"],
+            r["type_formation"],
+            r["assigne_par"],
+        )
+        for r in records
+    ]
+
+
+def inserer_temp(conn, lignes: list[tuple]):
+    """Insère les lignes dans la table temporaire attendue par la procédure stockée.
+
+    Nous utilisons fast executemany pour les performances.
     """
-    col_map = {
-        "Utilisateur - ID d'utilisateur": "id_utilisateur",
-        "Utilisateur - Sexe de l'utilisateur": "sexe_utilisateur",
-        "Utilisateur - Manager - Nom complet": "manager_nom",
-        "Formation - Titre de la formation": "titre_formation",
-        "Récapitulatif - Statut": "statut",
-        "Récapitulatif - Date d'inscription": "date_inscription",
-        "Récapitulatif - Date d'achèvement": "date_achevement",
-        "Formation - Heures de formation": "heures_formation",
-        "Formation - Type de formation": "type_formation",
-        "Récapitulatif - Assigné par": "assigne_par",
-    }
-    df_sql = df.rename(columns=col_map)
-    records = df_sql.to_dict("records")
-
     cursor = conn.cursor()
     cursor.fast_executemany = True
+    cursor.executemany(INSERT_SQL, lignes)
+    logger.info("Inserted %d rows into #TempOLU", len(lignes))
 
-    cursor.executemany(
-        "INSERT INTO #TempOLU (id_utilisateur, sexe_utilisateur, manager_nom, titre_formation, "
-        "statut, date_inscription, date_achevement, heures_formation, type_formation, assigne_par) "
-        "VALUES (?,?,?,?,?,?,?,?,?,?)",
-        [
-            (
-                r["id_utilisateur"],
-                r["sexe_utilisateur"],
-                r["manager_nom"],
-                r["titre_formation"],
-                r["statut"],
-                r["date_inscription"],
-                r["date_achevement"],
-                r["heures_formation"],
-                r["type_formation"],
-                r["assigne_par"],
-            )
-            for r in records
-        ],
-    )
-    logger.info("Inserted %d rows into #TempOLU", len(records))
+
+def charger_temp(conn, df: pd.DataFrame):
+    inserer_temp(conn, lignes_temp(df))
 
 
 def main():
@@ -128,13 +138,54 @@ def main():
         default=date.today(),
         help="Date d'extraction à passer à la procédure (YYYY-MM-DD)",
     )
+    validation.ajouter_arguments(ap)
+    pipeline.ajouter_arguments(ap)
+    diffusion.ajouter_arguments(ap)
+    ap.add_argument("--agregats", type=Path, help="Stock d'agrégats mensuels à mettre à jour")
     args = ap.parse_args()
-
-    df = nettoyer(lire_excel(args.excel))
-
-    with db.get_connection() as conn:
-        charger_temp(conn, df)
-        db.call_stored_procedure("sp_ImporterDonneesOLU", args.date)
+    if args.pipeline and args.cibles:
+        ap.error("--pipeline et --cibles sont incompatibles")
+
+    if not args.pipeline:
+        df = validation.controler(
+            lire_excel(args.excel), REGLES, args.excel, args.quarantaine, args.taux_rejet_max
+        )
+        df = nettoyer(df)
+
+    with db.instrument("Import OLU"):
+        if args.cibles:
+            # Paramètres construits une seule fois : seul l'envoi tourne dans les threads
+            lignes = lignes_temp(df)
+            resultats = diffusion.diffuser(
+                args.cibles, lambda conn: inserer_temp(conn, lignes), "sp_ImporterDonneesOLU", args.date
+            )
+            diffusion.verifier(resultats)
+        else:
+            with db.get_connection() as conn:
+                if args.pipeline:
+                    rapport = pipeline.importer_excel(
+                        args.excel,
+                        EXPECTED_COLS,
+                        REGLES,
+                        nettoyer,
+                        lambda bloc: charger_temp(conn, bloc),
+                        taille_bloc=args.taille_bloc,
+                        fichier_quarantaine=args.quarantaine,
+                        taux_rejet_max=args.taux_rejet_max,
+                        extraire=agregats.faits_olu if args.agregats else None,
+                    )
+                else:
+                    charger_temp(conn, df)
+                db.call_stored_procedure("sp_ImporterDonneesOLU", args.date)
+
+    if args.agregats:
+        # Après l'import : département, genre et contrat tels qu'enregistrés en base
+        collaborateurs = agregats.collaborateurs_base()
+        if args.pipeline:
+            faits = agregats.avec_collaborateurs(agregats.concatener(rapport.extraits), collaborateurs)
+        else:
+            faits = agregats.faits_olu(df, collaborateurs)
+        agregats.StockAgregats(args.agregats).appliquer(faits)
     logger.info("Import terminé avec succès")
 
 
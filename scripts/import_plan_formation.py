@@ -9,7 +9,7 @@ from pathlib import Path
 
 import pandas as pd
 
-from . import db
+from . import db, diffusion, pipeline, validation
 
 logger = logging.getLogger("import_plan")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -52,6 +52,12 @@ COL_MAP = {
     "Commentaires": "commentaires",
 }
 
+REGLES = validation.Regles(
+    requises=["CATEGORIE/OBJECTIF", ("ID COLLABORATEUR", "COLLABORATEUR"), "NOM FORMATION"],
+    numeriques=["PRIORITE", "DUREE", "TARIF HT", "BUDGET"],
+    bornes={"PRIORITE": (1, 5)},
+)
+
 INSERT_SQL = (
     "INSERT INTO #TempPlan (categorie, collaborateur, id_collaborateur, manager, departement, "
     "organisme_formation, type_formation, nom_formation, priorite, sessions, duree, tarif_ht, budget, "
@@ -82,49 +88,84 @@ def nettoyer(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def charger_temp(conn, df: pd.DataFrame):
-    df_sql = df.rename(columns=COL_MAP)
-    records = df_sql.to_dict("records")
+def lignes_temp(df: pd.DataFrame) -> list[tuple]:
+    """Paramètres d'insertion dans #TempPlan, dans l'ordre de ``INSERT_SQL``."""
+    records = df.rename(columns=COL_MAP).to_dict("records")
+    return [
+        (
+            r["categorie"],
+            r["collaborateur"],
+            r["id_collaborateur"],
+            r["manager"],
+            r["departement"],
+            r["organisme_formation"],
+            r["type_formation"],
+            r["nom_formation"],
+            r["priorite"],
+            r["sessions"],
+            r["duree"],
+            r["tarif_ht"],
+            r["budget"],
+            r["obligatoire"],
+            r["validee"],
+            r["commentaires"],
+        )
+        for r in records
+    ]
+
+
+def inserer_temp(conn, lignes: list[tuple]):
     cur = conn.cursor()
     cur.fast_executemany = True
-    cur.executemany(
-        INSERT_SQL,
-        [
-            (
-                r["categorie"],
-                r["collaborateur"],
-                r["id_collaborateur"],
-                r["manager"],
-                r["departement"],
-                r["organisme_formation"],
-                r["type_formation"],
-                r["nom_formation"],
-                r["priorite"],
-                r["sessions"],
-                r["duree"],
-                r["tarif_ht"],
-                r["budget"],
-                r["obligatoire"],
-                r["validee"],
-                r["commentaires"],
-            )
-            for r in records
-        ],
-    )
-    logger.info("Inséré %d lignes dans #TempPlan", len(records))
+    cur.executemany(INSERT_SQL, lignes)
+    logger.info("Inséré %d lignes dans #TempPlan", len(lignes))
+
+
+def charger_temp(conn, df: pd.DataFrame):
+    inserer_temp(conn, lignes_temp(df))
 
 
 def main():
     ap = argparse.ArgumentParser(description="Import Plan Formation")
     ap.add_argument("excel", type=Path)
     ap.add_argument("--annee", type=int, required=True, help="Année du budget (YYYY)")
+    validation.ajouter_arguments(ap)
+    pipeline.ajouter_arguments(ap)
+    diffusion.ajouter_arguments(ap)
     args = ap.parse_args()
-
-    df = nettoyer(lire_excel(args.excel))
-
-    with db.get_connection() as conn:
-        charger_temp(conn, df)
-        db.call_stored_procedure("sp_ImporterPlanFormation", args.annee)
+    if args.pipeline and args.cibles:
+        ap.error("--pipeline et --cibles sont incompatibles")
+
+    if not args.pipeline:
+        df = validation.controler(
+            lire_excel(args.excel), REGLES, args.excel, args.quarantaine, args.taux_rejet_max
+        )
+        df = nettoyer(df)
+
+    with db.instrument("Import Plan"):
+        if args.cibles:
+            # Paramètres construits une seule fois : seul l'envoi tourne dans les threads
+            lignes = lignes_temp(df)
+            resultats = diffusion.diffuser(
+                args.cibles, lambda conn: inserer_temp(conn, lignes), "sp_ImporterPlanFormation", args.annee
+            )
+            diffusion.verifier(resultats)
+        else:
+            with db.get_connection() as conn:
+                if args.pipeline:
+                    pipeline.importer_excel(
+                        args.excel,
+                        EXPECTED_COLS,
+                        REGLES,
+                        nettoyer,
+                        lambda bloc: charger_temp(conn, bloc),
+                        taille_bloc=args.taille_bloc,
+                        fichier_quarantaine=args.quarantaine,
+                        taux_rejet_max=args.taux_rejet_max,
+                    )
+                else:
+                    charger_temp(conn, df)
+                db.call_stored_procedure("sp_ImporterPlanFormation", args.annee)
 
     logger.info("Import Plan terminé")
 
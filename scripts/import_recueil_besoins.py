@@ -9,7 +9,7 @@ from pathlib import Path
 
 import pandas as pd
 
-from . import db
+from . import db, diffusion, pipeline, validation
 
 logger = logging.getLogger("import_recueil")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -46,6 +46,18 @@ COL_MAP = {
     "Commentaires": "commentaires",
 }
 
+REGLES = validation.Regles(
+    requises=[
+        ("ID COLLABORATEUR", "COLLABORATEUR"),
+        "MANAGER",
+        "DEPARTEMENT",
+        "NOM FORMATION",
+        "PRIORITE",
+    ],
+    numeriques=["PRIORITE", "DUREE", "TARIF HT"],
+    bornes={"PRIORITE": (1, 5)},
+)
+
 INSERT_SQL = (
     "INSERT INTO #TempRecueil (categorie, collaborateur, id_collaborateur, manager, departement, "
     "organisme_formation, type_formation, nom_formation, priorite, sessions, duree, tarif_ht, commentaires) "
@@ -71,46 +83,81 @@ def nettoyer(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def charger_temp(conn, df: pd.DataFrame):
-    df_sql = df.rename(columns=COL_MAP)
-    records = df_sql.to_dict("records")
+def lignes_temp(df: pd.DataFrame) -> list[tuple]:
+    """Paramètres d'insertion dans #TempRecueil, dans l'ordre de ``INSERT_SQL``."""
+    records = df.rename(columns=COL_MAP).to_dict("records")
+    return [
+        (
+            r["categorie"],
+            r["collaborateur"],
+            r["id_collaborateur"],
+            r["manager"],
+            r["departement"],
+            r["organisme_formation"],
+            r["type_formation"],
+            r["nom_formation"],
+            r["priorite"],
+            r["sessions"],
+            r["duree"],
+            r["tarif_ht"],
+            r["commentaires"],
+        )
+        for r in records
+    ]
+
+
+def inserer_temp(conn, lignes: list[tuple]):
     cur = conn.cursor()
     cur.fast_executemany = True
-    cur.executemany(
-        INSERT_SQL,
-        [
-            (
-                r["categorie"],
-                r["collaborateur"],
-                r["id_collaborateur"],
-                r["manager"],
-                r["departement"],
-                r["organisme_formation"],
-                r["type_formation"],
-                r["nom_formation"],
-                r["priorite"],
-                r["sessions"],
-                r["duree"],
-                r["tarif_ht"],
-                r["commentaires"],
-            )
-            for r in records
-        ],
-    )
-    logger.info("Inséré %d lignes dans #TempRecueil", len(records))
+    cur.executemany(INSERT_SQL, lignes)
+    logger.info("Inséré %d lignes dans #TempRecueil", len(lignes))
+
+
+def charger_temp(conn, df: pd.DataFrame):
+    inserer_temp(conn, lignes_temp(df))
 
 
 def main():
     ap = argparse.ArgumentParser(description="Import Recueil Besoins")
     ap.add_argument("excel", type=Path)
     ap.add_argument("--annee", type=int, required=True)
+    validation.ajouter_arguments(ap)
+    pipeline.ajouter_arguments(ap)
+    diffusion.ajouter_arguments(ap)
     args = ap.parse_args()
-
-    df = nettoyer(lire_excel(args.excel))
-
-    with db.get_connection() as conn:
-        charger_temp(conn, df)
-        db.call_stored_procedure("sp_ImporterRecueilBesoins", args.annee)
+    if args.pipeline and args.cibles:
+        ap.error("--pipeline et --cibles sont incompatibles")
+
+    if not args.pipeline:
+        df = validation.controler(
+            lire_excel(args.excel), REGLES, args.excel, args.quarantaine, args.taux_rejet_max
+        )
+        df = nettoyer(df)
+
+    with db.instrument("Import Recueil"):
+        if args.cibles:
+            # Paramètres construits une seule fois : seul l'envoi tourne dans les threads
+            lignes = lignes_temp(df)
+            resultats = diffusion.diffuser(
+                args.cibles, lambda conn: inserer_temp(conn, lignes), "sp_ImporterRecueilBesoins", args.annee
+            )
+            diffusion.verifier(resultats)
+        else:
+            with db.get_connection() as conn:
+                if args.pipeline:
+                    pipeline.importer_excel(
+                        args.excel,
+                        EXPECTED_COLS,
+                        REGLES,
+                        nettoyer,
+                        lambda bloc: charger_temp(conn, bloc),
+                        taille_bloc=args.taille_bloc,
+                        fichier_quarantaine=args.quarantaine,
+                        taux_rejet_max=args.taux_rejet_max,
+                    )
+                else:
+                    charger_temp(conn, df)
+                db.call_stored_procedure("sp_ImporterRecueilBesoins", args.annee)
 
     logger.info("Import Recueil terminé")
 
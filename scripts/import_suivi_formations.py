@@ -13,11 +13,10 @@ import argparse
 import logging
 from datetime import date
 from pathlib import Path
-from typing import Any
 
 import pandas as pd
 
-from . import db
+from . import agregats, db, diffusion, pipeline, validation
 
 logger = logging.getLogger("import_suivi")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -54,6 +53,22 @@ COL_MAP: dict[str, str] = {
     "Commentaires": "commentaires",
 }
 
+REGLES = validation.Regles(
+    requises=[
+        "CATEGORIE",
+        "ID COLLABORATEUR",
+        "GENRE",
+        "DEPARTEMENT",
+        "CONTRAT",
+        "NOM FORMATION",
+        "DUREE",
+    ],
+    numeriques=["TARIF HT"],
+    durees=["DUREE"],
+    dates=["DU", "AU"],
+    valeurs={"GENRE": ["Homme", "Femme"]},
+)
+
 INSERT_SQL = (
     "INSERT INTO #TempSuivi (categorie, id_collaborateur, genre, manager, departement, "
     "contrat, organisme_formation, nom_formation, date_du, date_au, duree, tarif_ht, commentaires) "
@@ -73,66 +88,97 @@ def lire_excel(path: Path) -> pd.DataFrame:
 
 def nettoyer(df: pd.DataFrame) -> pd.DataFrame:
     df = df.copy()
-
-    def parse_date(value: Any):
-        if pd.isna(value):
-            return None
-        try:
-            return pd.to_datetime(value, dayfirst=False, errors="coerce").date()
-        except Exception:
-            return None
-
-    df["DU"] = df["DU"].apply(parse_date)
-    df["AU"] = df["AU"].apply(parse_date)
+    df["DU"] = validation.vers_dates_python(df["DU"])
+    df["AU"] = validation.vers_dates_python(df["AU"])
 
     # Nombreux champs numériques
-    df["DUREE"] = pd.to_numeric(df["DUREE"], errors="coerce")
+    df["DUREE"] = validation.vers_heures(df["DUREE"])
     df["TARIF HT"] = pd.to_numeric(df["TARIF HT"], errors="coerce")
 
     return df
 
 
-def charger_temp(conn, df: pd.DataFrame):
-    df_sql = df.rename(columns=COL_MAP)
-    records = df_sql.to_dict("records")
-
+def lignes_temp(df: pd.DataFrame) -> list[tuple]:
+    """Paramètres d'insertion dans #TempSuivi, dans l'ordre de ``INSERT_SQL``."""
+    records = df.rename(columns=COL_MAP).to_dict("records")
+    return [
+        (
+            r["categorie"],
+            r["id_collaborateur"],
+            r["genre"],
+            r["manager"],
+            r["departement"],
+            r["contrat"],
+            r["organisme_formation"],
+            r["nom_formation"],
+            r["date_du"],
+            r["date_au"],
+            r["duree"],
+            r["tarif_ht"],
+            r["commentaires"],
+        )
+        for r in records
+    ]
+
+
+def inserer_temp(conn, lignes: list[tuple]):
     cur = conn.cursor()
     cur.fast_executemany = True
-    cur.executemany(
-        INSERT_SQL,
-        [
-            (
-                r["categorie"],
-                r["id_collaborateur"],
-                r["genre"],
-                r["manager"],
-                r["departement"],
-                r["contrat"],
-                r["organisme_formation"],
-                r["nom_formation"],
-                r["date_du"],
-                r["date_au"],
-                r["duree"],
-                r["tarif_ht"],
-                r["commentaires"],
-            )
-            for r in records
-        ],
-    )
-    logger.info("Inséré %d lignes dans #TempSuivi", len(records))
+    cur.executemany(INSERT_SQL, lignes)
+    logger.info("Inséré %d lignes dans #TempSuivi", len(lignes))
+
+
+def charger_temp(conn, df: pd.DataFrame):
+    inserer_temp(conn, lignes_temp(df))
 
 
 def main():
     ap = argparse.ArgumentParser(description="Import Suivi Formations")
     ap.add_argument("excel", type=Path)
     ap.add_argument("--date", type=lambda s: date.fromisoformat(s), default=date.today())
+    validation.ajouter_arguments(ap)
+    pipeline.ajouter_arguments(ap)
+    diffusion.ajouter_arguments(ap)
+    ap.add_argument("--agregats", type=Path, help="Stock d'agrégats mensuels à mettre à jour")
     args = ap.parse_args()
-
-    df = nettoyer(lire_excel(args.excel))
-
-    with db.get_connection() as conn:
-        charger_temp(conn, df)
-        db.call_stored_procedure("sp_ImporterDonneesSuiviFormation", args.date)
+    if args.pipeline and args.cibles:
+        ap.error("--pipeline et --cibles sont incompatibles")
+
+    if not args.pipeline:
+        df = validation.controler(
+            lire_excel(args.excel), REGLES, args.excel, args.quarantaine, args.taux_rejet_max
+        )
+        df = nettoyer(df)
+
+    with db.instrument("Import Suivi"):
+        if args.cibles:
+            # Paramètres construits une seule fois : seul l'envoi tourne dans les threads
+            lignes = lignes_temp(df)
+            resultats = diffusion.diffuser(
+                args.cibles, lambda conn: inserer_temp(conn, lignes), "sp_ImporterDonneesSuiviFormation", args.date
+            )
+            diffusion.verifier(resultats)
+        else:
+            with db.get_connection() as conn:
+                if args.pipeline:
+                    rapport = pipeline.importer_excel(
+                        args.excel,
+                        EXPECTED_COLS,
+                        REGLES,
+                        nettoyer,
+                        lambda bloc: charger_temp(conn, bloc),
+                        taille_bloc=args.taille_bloc,
+                        fichier_quarantaine=args.quarantaine,
+                        taux_rejet_max=args.taux_rejet_max,
+                        extraire=(lambda bloc: agregats.faits_suivi(bloc, args.date)) if args.agregats else None,
+                    )
+                else:
+                    charger_temp(conn, df)
+                db.call_stored_procedure("sp_ImporterDonneesSuiviFormation", args.date)
+
+    if args.agregats:
+        faits = agregats.concatener(rapport.extraits) if args.pipeline else agregats.faits_suivi(df, args.date)
+        agregats.StockAgregats(args.agregats).appliquer(faits)
 
     logger.info("Import Suivi terminé")
 
@@ -0,0 +1,160 @@
+"""Moteur des formations obligatoires non suivies.
+
+Remplace côté Python l'alerte « Formations obligatoires non suivies » de
+``sp_TableauDeBord``, qui croise ``Formations`` et ``Collaborateurs`` (CROSS JOIN)
+avant de chercher les inscriptions. Ici seules les paires
+(collaborateur, formation obligatoire) effectivement suivies sont stockées, au
+format CSR (``indptr`` / ``colonnes``) : la mémoire est proportionnelle au nombre
+d'inscriptions et non au produit collaborateurs × formations. Les lacunes se
+déduisent par complément, de façon vectorisée.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from .hierarchie import IndexHierarchie
+
+logger = logging.getLogger(__name__)
+
+TAILLE_BLOC = 10_000  # lignes matérialisées à la fois pour les listes de lacunes
+
+
+class MatriceObligatoires:
+    """Matrice creuse collaborateur × formation obligatoire des formations suivies.
+
+    ``collaborateurs`` : colonnes ``id_collaborateur``, ``departement``, ``id_manager``.
+    ``formations`` : noms des formations obligatoires.
+    ``inscriptions`` : colonnes ``id_collaborateur``, ``nom_formation`` (tous statuts).
+    """
+
+    def __init__(
+        self,
+        collaborateurs: pd.DataFrame,
+        formations: Iterable[str],
+        inscriptions: pd.DataFrame,
+    ):
+        self.collaborateurs = collaborateurs.reset_index(drop=True)
+        self.ids = pd.Index(self.collaborateurs["id_collaborateur"])
+        self.formations = pd.Index(sorted(set(formations)), name="nom_formation")
+        n, f = len(self.ids), len(self.formations)
+
+        ligne = self.ids.get_indexer(inscriptions["id_collaborateur"])
+        colonne = self.formations.get_indexer(inscriptions["nom_formation"])
+        connues = (ligne >= 0) & (colonne >= 0)
+        # Dédoublonnage des inscriptions multiples à la même formation.
+        cles = np.unique(ligne[connues].astype(np.int64) * f + colonne[connues])
+        self.colonnes = (cles % f).astype(np.int32) if f else np.empty(0, np.int32)
+        lignes = cles // f if f else np.empty(0, np.int64)
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(lignes, minlength=n), out=self.indptr[1:])
+        self._lignes = lignes
+
+        self.nombre_suivies = np.diff(self.indptr)
+        self.nombre_manquantes = f - self.nombre_suivies
+        logger.info(
+            "Matrice obligatoires: %d collaborateurs × %d formations, %d suivies, %d manquantes",
+            n,
+            f,
+            len(cles),
+            self.total_manquantes,
+        )
+
+    @classmethod
+    def charger(cls) -> "MatriceObligatoires":
+        """Construit la matrice depuis la base via ``sp_ListerCollaborateurs``
+        et ``sp_ListerInscriptionsObligatoires``."""
+        from . import db
+
+        (collaborateurs,) = db.fetch_dataframes("sp_ListerCollaborateurs")
+        # Une ligne par formation obligatoire (id_collaborateur NULL si personne ne l'a suivie)
+        (inscriptions,) = db.fetch_dataframes("sp_ListerInscriptionsObligatoires")
+        return cls(collaborateurs, inscriptions["nom_formation"].unique(), inscriptions.dropna())
+
+    @property
+    def total_manquantes(self) -> int:
+        """Équivalent de l'alerte de ``sp_TableauDeBord``."""
+        return int(self.nombre_manquantes.sum())
+
+    def manquantes(self, id_collaborateur: str) -> list[str]:
+        i = self.ids.get_loc(id_collaborateur)
+        suivies = self.colonnes[self.indptr[i] : self.indptr[i + 1]]
+        masque = np.ones(len(self.formations), dtype=bool)
+        masque[suivies] = False
+        return list(self.formations[masque])
+
+    def lacunes(self, id_collaborateurs: Iterable[str] | None = None) -> pd.DataFrame:
+        """Paires (collaborateur, formation obligatoire non suivie), au format long.
+
+        Calcul par blocs de ``TAILLE_BLOC`` collaborateurs pour borner la mémoire.
+        """
+        if id_collaborateurs is None:
+            selection = np.flatnonzero(self.nombre_manquantes > 0)
+        else:
+            selection = self.ids.get_indexer(list(id_collaborateurs))
+            if (selection < 0).any():
+                raise KeyError("Collaborateurs inconnus dans la sélection")
+        f = len(self.formations)
+        morceaux = []
+        for debut in range(0, len(selection), TAILLE_BLOC):
+            bloc = selection[debut : debut + TAILLE_BLOC]
+            manque = np.ones((len(bloc), f), dtype=bool)
+            longueurs = self.nombre_suivies[bloc]
+            positions = np.repeat(self.indptr[bloc], longueurs) + (
+                np.arange(longueurs.sum()) - np.repeat(np.cumsum(longueurs) - longueurs, longueurs)
+            )
+            manque[np.repeat(np.arange(len(bloc)), longueurs), self.colonnes[positions]] = False
+            r, c = np.nonzero(manque)
+            morceaux.append(
+                pd.DataFrame({"id_collaborateur": self.ids[bloc[r]], "nom_formation": self.formations[c]})
+            )
+        if not morceaux:
+            return pd.DataFrame(columns=["id_collaborateur", "nom_formation"])
+        return pd.concat(morceaux, ignore_index=True)
+
+    def par_collaborateur(self, seulement_incomplets: bool = True) -> pd.DataFrame:
+        resultat = self.collaborateurs.assign(
+            nombre_suivies=self.nombre_suivies, nombre_manquantes=self.nombre_manquantes
+        )
+        if seulement_incomplets:
+            resultat = resultat[resultat["nombre_manquantes"] > 0]
+        return resultat
+
+    def par_groupe(self, colonne: str) -> pd.DataFrame:
+        """Nombre de collaborateurs n'ayant pas suivi chaque formation, par groupe.
+
+        Résultat groupe × formation : effectif du groupe moins les paires suivies.
+        """
+        codes, groupes = pd.factorize(self.collaborateurs[colonne], use_na_sentinel=False)
+        g, f = len(groupes), len(self.formations)
+        effectifs = np.bincount(codes, minlength=g)
+        suivies = np.bincount(codes[self._lignes] * f + self.colonnes, minlength=g * f).reshape(g, f)
+        return pd.DataFrame(
+            effectifs[:, None] - suivies,
+            index=pd.Index(groupes, name=colonne),
+            columns=self.formations,
+        )
+
+    def par_departement(self) -> pd.DataFrame:
+        return self.par_groupe("departement")
+
+    def par_manager(self) -> pd.DataFrame:
+        """Lacunes des collaborateurs directs de chaque manager."""
+        return self.par_groupe("id_manager")
+
+    def par_organisation(self, index: IndexHierarchie) -> pd.DataFrame:
+        """Lacunes cumulées sur l'organisation complète (directs et indirects) de chaque manager."""
+        valeurs = pd.DataFrame(
+            {"nombre_manquantes": self.nombre_manquantes, "nombre_suivies": self.nombre_suivies},
+            index=self.ids,
+        )
+        return index.cumuler(valeurs)
+
+
+def obligatoires_du_plan(df_plan: pd.DataFrame) -> list[str]:
+    """Formations marquées obligatoires dans un plan de formation nettoyé (``import_plan_formation.nettoyer``)."""
+    obligatoire = df_plan["OBLIGATOIRE OU NON"].astype(bool)
+    return sorted(df_plan.loc[obligatoire, "NOM FORMATION"].dropna().unique())
@@ -0,0 +1,327 @@
+"""Exécution pipelinée lecture → nettoyage → chargement.
+
+En mode séquentiel, ``lire_excel`` parse tout le fichier, puis ``nettoyer``
+traite tout le DataFrame, puis ``charger_temp`` envoie tout au serveur : le CPU
+est inactif pendant l'envoi réseau et le réseau pendant le parsing openpyxl.
+
+Ici le fichier est lu par blocs (openpyxl en lecture seule) et chaque étape
+tourne dans son propre thread, reliée à la suivante par une file bornée :
+le bloc N+1 est parsé et nettoyé pendant que le bloc N est envoyé par
+``executemany`` (pyodbc libère le GIL pendant les échanges réseau). Les files
+bornées assurent la contre-pression : au plus ``2 * profondeur + 3`` blocs sont
+en mémoire. La durée totale tend vers celle de l'étape la plus lente.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Sequence
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from . import validation
+
+logger = logging.getLogger(__name__)
+
+TAILLE_BLOC = 5_000
+PROFONDEUR = 2
+
+_FIN = object()
+
+
+@dataclass
+class StatsEtape:
+    nom: str
+    blocs: int = 0
+    lignes: int = 0
+    actif: float = 0.0  # secondes passées à travailler
+    attente: float = 0.0  # secondes bloquées sur une file (vide en entrée ou pleine en sortie)
+
+    def utilisation(self, duree: float) -> float:
+        return self.actif / duree if duree else 0.0
+
+
+@dataclass
+class RapportPipeline:
+    duree: float
+    etapes: list[StatsEtape]
+    lignes_chargees: int = 0
+    quarantaine: pd.DataFrame | None = None
+    extraits: list[Any] = field(default_factory=list)
+
+    def journaliser(self) -> None:
+        for e in self.etapes:
+            logger.info(
+                "Étape %-10s %4d blocs %8d lignes  actif %6.2f s (%3.0f %%)  attente %6.2f s",
+                e.nom,
+                e.blocs,
+                e.lignes,
+                e.actif,
+                e.utilisation(self.duree) * 100,
+                e.attente,
+            )
+        somme = sum(e.actif for e in self.etapes)
+        logger.info("Pipeline: %.2f s au total pour %.2f s de travail cumulé", self.duree, somme)
+
+
+def _texte(valeur: Any) -> str | None:
+    """Même représentation que ``pd.read_excel(dtype=str)``."""
+    if valeur is None:
+        return None
+    if isinstance(valeur, float) and valeur.is_integer():
+        return str(int(valeur))
+    return str(valeur)
+
+
+def compter_lignes(path: Path) -> int | None:
+    """Nombre de lignes de données annoncé par la première feuille (en-tête exclu).
+
+    ``max_row`` provient de la dimension enregistrée dans le fichier : lignes
+    vides comprises, c'est un majorant du nombre de lignes validées. ``None`` si
+    le fichier ne la renseigne pas.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        max_row = wb.worksheets[0].max_row
+    finally:
+        wb.close()
+    return max_row - 1 if max_row else None
+
+
+def lire_excel_par_blocs(
+    path: Path, colonnes_attendues: Sequence[str], taille_bloc: int = TAILLE_BLOC
+) -> Iterator[pd.DataFrame]:
+    """Lit la première feuille par blocs de ``taille_bloc`` lignes, en texte comme ``lire_excel``.
+
+    L'index des blocs suit la numérotation globale des lignes de données, lignes
+    vides comprises : ``index + 2`` est le numéro de ligne Excel.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        lignes = wb.worksheets[0].iter_rows(values_only=True)
+        entete = [str(c).strip() if c is not None else "" for c in next(lignes, ())]
+        missing = set(colonnes_attendues) - set(entete)
+        if missing:
+            raise ValueError(f"Colonnes manquantes: {', '.join(missing)}")
+        bloc: list[list[str | None]] = []
+        numeros: list[int] = []
+        for numero, ligne in enumerate(lignes):
+            if all(v is None for v in ligne):
+                continue
+            bloc.append([_texte(v) for v in ligne])
+            numeros.append(numero)
+            if len(bloc) == taille_bloc:
+                yield pd.DataFrame(bloc, columns=entete, index=numeros)
+                bloc, numeros = [], []
+        if bloc:
+            yield pd.DataFrame(bloc, columns=entete, index=numeros)
+    finally:
+        wb.close()
+
+
+def executer(
+    source: Iterable[pd.DataFrame],
+    transformer: Callable[[pd.DataFrame], pd.DataFrame],
+    charger: Callable[[pd.DataFrame], None],
+    profondeur: int = PROFONDEUR,
+) -> RapportPipeline:
+    """Enchaîne ``source`` → ``transformer`` → ``charger`` sur trois threads.
+
+    ``charger`` s'exécute dans le thread appelant (la connexion pyodbc y reste).
+    La première exception d'une étape arrête le pipeline et est relancée ici.
+    """
+    lus: queue.Queue = queue.Queue(maxsize=profondeur)
+    propres: queue.Queue = queue.Queue(maxsize=profondeur)
+    arret = threading.Event()
+    erreurs: list[BaseException] = []
+    lecture, nettoyage, chargement = StatsEtape("lecture"), StatsEtape("nettoyage"), StatsEtape("chargement")
+
+    def deposer(file: queue.Queue, element: Any, stats: StatsEtape) -> bool:
+        t = time.perf_counter()
+        while not arret.is_set():
+            try:
+                file.put(element, timeout=0.1)
+                stats.attente += time.perf_counter() - t
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def prendre(file: queue.Queue, stats: StatsEtape) -> Any:
+        t = time.perf_counter()
+        while not arret.is_set():
+            try:
+                element = file.get(timeout=0.1)
+                stats.attente += time.perf_counter() - t
+                return element
+            except queue.Empty:
+                continue
+        return _FIN
+
+    def lire() -> None:
+        try:
+            iterateur = iter(source)
+            while not arret.is_set():
+                t = time.perf_counter()
+                bloc = next(iterateur, _FIN)
+                lecture.actif += time.perf_counter() - t
+                if bloc is _FIN:
+                    break
+                lecture.blocs += 1
+                lecture.lignes += len(bloc)
+                if not deposer(lus, bloc, lecture):
+                    return
+        except BaseException as exc:  # transmis au thread appelant
+            erreurs.append(exc)
+            arret.set()
+        deposer(lus, _FIN, lecture)
+
+    def nettoyer() -> None:
+        try:
+            while True:
+                bloc = prendre(lus, nettoyage)
+                if bloc is _FIN:
+                    break
+                t = time.perf_counter()
+                bloc = transformer(bloc)
+                nettoyage.actif += time.perf_counter() - t
+                nettoyage.blocs += 1
+                nettoyage.lignes += len(bloc)
+                if not deposer(propres, bloc, nettoyage):
+                    return
+        except BaseException as exc:
+            erreurs.append(exc)
+            arret.set()
+        deposer(propres, _FIN, nettoyage)
+
+    debut = time.perf_counter()
+    threads = [
+        threading.Thread(target=lire, name="pipeline-lecture", daemon=True),
+        threading.Thread(target=nettoyer, name="pipeline-nettoyage", daemon=True),
+    ]
+    for th in threads:
+        th.start()
+    try:
+        while True:
+            bloc = prendre(propres, chargement)
+            if bloc is _FIN:
+                break
+            t = time.perf_counter()
+            charger(bloc)
+            chargement.actif += time.perf_counter() - t
+            chargement.blocs += 1
+            chargement.lignes += len(bloc)
+    except BaseException as exc:
+        erreurs.append(exc)
+    finally:
+        arret.set()
+        for th in threads:
+            th.join()
+    if erreurs:
+        raise erreurs[0]
+
+    return RapportPipeline(
+        duree=time.perf_counter() - debut,
+        etapes=[lecture, nettoyage, chargement],
+        lignes_chargees=chargement.lignes,
+    )
+
+
+def importer_excel(
+    path: Path,
+    colonnes_attendues: Sequence[str],
+    regles: validation.Regles,
+    nettoyer: Callable[[pd.DataFrame], pd.DataFrame],
+    charger: Callable[[pd.DataFrame], None],
+    taille_bloc: int = TAILLE_BLOC,
+    profondeur: int = PROFONDEUR,
+    fichier_quarantaine: Path | None = None,
+    taux_rejet_max: float = 0.1,
+    extraire: Callable[[pd.DataFrame], Any] | None = None,
+) -> RapportPipeline:
+    """Version pipelinée de ``controler`` + ``nettoyer`` + ``charger_temp`` d'un script d'import.
+
+    La validation se fait bloc par bloc. Le pipeline est arrêté dès que les
+    lignes en quarantaine dépassent ``taux_rejet_max`` du nombre de lignes
+    annoncé par la feuille (``compter_lignes``) : le contrôle final échouerait
+    de toute façon, le reste du fichier n'est pas envoyé. Le contrôle final
+    porte sur tout le fichier, avant l'appel de la procédure stockée par
+    l'appelant, et donne le même verdict que ``validation.controler``.
+    ``extraire`` est appliqué à chaque bloc nettoyé (ex. faits pour les agrégats)
+    et ses résultats sont conservés dans ``RapportPipeline.extraits``.
+    """
+    rejets: list[pd.DataFrame] = []
+    profils: list[pd.DataFrame] = []
+    extraits: list[Any] = []
+    lignes_validees = [0]  # hors lignes vides
+    lignes_rejetees = [0]
+    annoncees = compter_lignes(path)
+
+    def controler_taux(rejetees: int, total: int) -> None:
+        taux = rejetees / total if total else 0.0
+        if taux > taux_rejet_max:
+            raise ValueError(
+                f"Fichier rejeté: {rejetees}/{total} lignes invalides "
+                f"({taux:.0%} > {taux_rejet_max:.0%})"
+            )
+
+    def transformer(bloc: pd.DataFrame) -> pd.DataFrame:
+        rapport = validation.valider(bloc, regles)
+        lignes_validees[0] += len(rapport.propres) + len(rapport.quarantaine)
+        lignes_rejetees[0] += len(rapport.quarantaine)
+        if len(rapport.quarantaine):
+            rejets.append(rapport.quarantaine)
+        if annoncees and lignes_rejetees[0] > taux_rejet_max * annoncees:
+            # Rejet acquis quel que soit le reste du fichier. Lève dans le thread
+            # de nettoyage : ``executer`` arrête la lecture et le chargement
+            controler_taux(lignes_rejetees[0], lignes_validees[0])
+        profils.append(rapport.profil[["nb_nuls", "nb_echecs_conversion"]])
+        propre = nettoyer(rapport.propres)
+        if extraire is not None:
+            extraits.append(extraire(propre))
+        return propre
+
+    def charger_non_vide(bloc: pd.DataFrame) -> None:
+        # executemany refuse une liste de paramètres vide (bloc entièrement en quarantaine)
+        if len(bloc):
+            charger(bloc)
+
+    def ecrire_rejets() -> pd.DataFrame | None:
+        if not rejets:
+            return None
+        quarantaine = pd.concat(rejets)
+        cible = fichier_quarantaine or path.with_name(f"{path.stem}.quarantaine.csv")
+        validation.ecrire_quarantaine(quarantaine, cible)
+        return quarantaine
+
+    try:
+        rapport = executer(
+            lire_excel_par_blocs(path, colonnes_attendues, taille_bloc), transformer, charger_non_vide, profondeur
+        )
+    except ValueError:
+        # Rejet anticipé : on conserve les lignes en quarantaine déjà identifiées
+        ecrire_rejets()
+        raise
+    rapport.extraits = extraits
+
+    total = lignes_validees[0]
+    if profils:
+        profil = sum(profils[1:], profils[0])
+        profil["taux_nuls"] = profil["nb_nuls"] / total if total else 0.0
+        validation.journaliser_profil(profil)
+    rapport.quarantaine = ecrire_rejets()
+    controler_taux(lignes_rejetees[0], total)
+    rapport.journaliser()
+    return rapport
+
+
+def ajouter_arguments(ap: argparse.ArgumentParser) -> None:
+    """Options communes aux scripts d'import pour le mode pipeliné."""
+    ap.add_argument("--pipeline", action="store_true", help="Lecture, nettoyage et chargement en parallèle par blocs")
+    ap.add_argument("--taille-bloc", type=int, default=TAILLE_BLOC, help="Lignes par bloc en mode pipeline")
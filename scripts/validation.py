@@ -0,0 +1,234 @@
+"""Contrôle qualité des fichiers Excel avant tout envoi au serveur SQL.
+
+Une seule passe vectorisée par fichier calcule, pour chaque colonne, le nombre
+de valeurs nulles et d'échecs de conversion (nombres, dates). Les lignes qui
+violent une règle obligatoire sont écartées dans un fichier de quarantaine
+(CSV ou Parquet, avec le motif) ; seules les lignes propres sont chargées.
+Un fichier trop dégradé est rejeté immédiatement, sans aller-retour serveur.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_PANDAS_2 = int(pd.__version__.split(".")[0]) >= 2
+
+MOTIF_COL = "motif_quarantaine"
+LIGNE_COL = "ligne_excel"
+
+
+@dataclass
+class Regles:
+    """Règles de qualité d'un fichier.
+
+    Un élément de ``requises`` peut être un tuple de colonnes : au moins l'une
+    d'elles doit alors être renseignée (ex. ``ID COLLABORATEUR`` ou
+    ``COLLABORATEUR``).
+    """
+
+    requises: Sequence[str | tuple[str, ...]] = ()
+    numeriques: Sequence[str] = ()
+    durees: Sequence[str] = ()  # heures, en nombre ou en ``H:MM:SS``
+    dates: Sequence[str] = ()
+    valeurs: dict[str, Sequence[str]] = field(default_factory=dict)
+    bornes: dict[str, tuple[float, float]] = field(default_factory=dict)
+
+
+@dataclass
+class RapportQualite:
+    propres: pd.DataFrame
+    quarantaine: pd.DataFrame
+    profil: pd.DataFrame
+    lignes_vides: int = 0
+
+    @property
+    def taux_quarantaine(self) -> float:
+        total = len(self.propres) + len(self.quarantaine)
+        return len(self.quarantaine) / total if total else 0.0
+
+
+def vers_nombres(serie: pd.Series) -> pd.Series:
+    return pd.to_numeric(serie, errors="coerce")
+
+
+def vers_heures(serie: pd.Series) -> pd.Series:
+    """Durées en heures décimales : nombres tels quels, ``2:00:00`` / ``1:30:00`` convertis."""
+    heures = vers_nombres(serie)
+    texte = heures.isna() & serie.notna()
+    if texte.any():
+        duree = pd.to_timedelta(serie[texte].astype(str).str.strip(), errors="coerce")
+        heures[texte] = duree.dt.total_seconds() / 3600
+    return heures
+
+
+def vers_dates(serie: pd.Series) -> pd.Series:
+    """Convertit toute une colonne en ``datetime64`` (NaT si invalide)."""
+    if _PANDAS_2:
+        # Sans format="mixed", pandas 2 déduit le format de la première valeur
+        # et invalide silencieusement toutes les autres écritures.
+        return pd.to_datetime(serie, errors="coerce", format="mixed")
+    return pd.to_datetime(serie, errors="coerce")
+
+
+def vers_dates_python(serie: pd.Series) -> pd.Series:
+    """Comme :func:`vers_dates` mais retourne des ``date`` Python ou ``None`` pour pyodbc."""
+    dates = vers_dates(serie)
+    return dates.dt.date.astype(object).where(dates.notna(), None)
+
+
+def _renseigne(serie: pd.Series) -> pd.Series:
+    if pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.notna()
+    return serie.notna() & (serie.astype(str).str.strip() != "")
+
+
+def _colonnes(regles: Regles) -> list[str]:
+    cols: list[str] = []
+    for regle in regles.requises:
+        cols.extend(regle if isinstance(regle, tuple) else (regle,))
+    cols.extend(regles.numeriques)
+    cols.extend(regles.durees)
+    cols.extend(regles.dates)
+    cols.extend(regles.valeurs)
+    cols.extend(regles.bornes)
+    return list(dict.fromkeys(cols))
+
+
+def valider(df: pd.DataFrame, regles: Regles) -> RapportQualite:
+    """Profile ``df`` et sépare les lignes propres des lignes en quarantaine.
+
+    Les lignes propres sont renvoyées telles quelles (aucune conversion) :
+    la conversion reste le rôle de ``nettoyer`` dans chaque script d'import.
+    Les lignes entièrement vides (mise en forme des modèles) sont écartées sans
+    être comptées ; ``ligne_excel`` suit l'index de ``df`` (0 = première ligne de données).
+    """
+    vide = ~np.logical_or.reduce([_renseigne(df[c]).to_numpy() for c in df.columns]) if len(df.columns) else None
+    lignes_vides = int(vide.sum()) if vide is not None else 0
+    if lignes_vides:
+        df = df[~vide]
+    n = len(df)
+    renseigne = {col: _renseigne(df[col]) for col in _colonnes(regles)}
+    converties: dict[str, pd.Series] = {}
+    echecs: dict[str, pd.Series] = {}
+    for col in regles.numeriques:
+        converties[col] = vers_nombres(df[col])
+        echecs[col] = renseigne[col] & converties[col].isna()
+    for col in regles.durees:
+        converties[col] = vers_heures(df[col])
+        echecs[col] = renseigne[col] & converties[col].isna()
+    for col in regles.dates:
+        converties[col] = vers_dates(df[col])
+        echecs[col] = renseigne[col] & converties[col].isna()
+
+    # (masque des lignes fautives, motif) pour chaque règle violée
+    violations: list[tuple[pd.Series, str]] = []
+    for regle in regles.requises:
+        if isinstance(regle, tuple):
+            present = np.logical_or.reduce([renseigne[c].to_numpy() for c in regle])
+            violations.append((pd.Series(~present, index=df.index), f"{' / '.join(regle)} manquant"))
+        else:
+            violations.append((~renseigne[regle], f"{regle} manquant"))
+            if regle in echecs:
+                violations.append((echecs[regle], f"{regle} invalide"))
+    for col, autorisees in regles.valeurs.items():
+        hors_liste = renseigne[col] & ~df[col].astype(str).str.strip().isin(autorisees)
+        violations.append((hors_liste, f"{col} hors liste"))
+    for col, (mini, maxi) in regles.bornes.items():
+        valeurs = converties[col] if col in converties else vers_nombres(df[col])
+        hors_bornes = valeurs.notna() & ~valeurs.between(mini, maxi)
+        violations.append((hors_bornes, f"{col} hors bornes [{mini:g}-{maxi:g}]"))
+
+    motifs = pd.Series("", index=df.index, dtype=object)
+    rejet = pd.Series(False, index=df.index)
+    for masque, motif in violations:
+        if masque.any():
+            motifs = motifs.where(~masque, motifs + np.where(motifs == "", "", "; ") + motif)
+            rejet |= masque
+
+    profil = pd.DataFrame(
+        {
+            "nb_nuls": [int((~renseigne[c]).sum()) for c in renseigne],
+            "nb_echecs_conversion": [int(echecs[c].sum()) if c in echecs else 0 for c in renseigne],
+        },
+        index=pd.Index(list(renseigne), name="colonne"),
+    )
+    profil["taux_nuls"] = profil["nb_nuls"] / n if n else 0.0
+
+    quarantaine = df[rejet].copy()
+    # +2 : en-tête Excel et numérotation à partir de 1
+    quarantaine.insert(0, LIGNE_COL, quarantaine.index + 2)
+    quarantaine[MOTIF_COL] = motifs[rejet]
+    return RapportQualite(propres=df[~rejet], quarantaine=quarantaine, profil=profil, lignes_vides=lignes_vides)
+
+
+def ecrire_quarantaine(df: pd.DataFrame, path: Path) -> None:
+    """Écrit les lignes en quarantaine en Parquet si l'extension l'indique, sinon en CSV."""
+    if path.suffix.lower() == ".parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False, encoding="utf-8-sig", sep=";")
+    logger.warning("%d lignes mises en quarantaine dans %s", len(df), path)
+
+
+def journaliser_profil(profil: pd.DataFrame) -> None:
+    anomalies = profil[(profil["nb_nuls"] > 0) | (profil["nb_echecs_conversion"] > 0)]
+    for colonne, ligne in anomalies.iterrows():
+        logger.info(
+            "Qualité %-35s nuls=%d (%.1f%%) conversions échouées=%d",
+            colonne,
+            ligne["nb_nuls"],
+            ligne["taux_nuls"] * 100,
+            ligne["nb_echecs_conversion"],
+        )
+
+
+def ajouter_arguments(ap: argparse.ArgumentParser) -> None:
+    """Options communes aux scripts d'import pour la quarantaine."""
+    ap.add_argument(
+        "--quarantaine",
+        type=Path,
+        default=None,
+        help="Fichier des lignes rejetées (.csv ou .parquet), par défaut <excel>.quarantaine.csv",
+    )
+    ap.add_argument(
+        "--taux-rejet-max",
+        type=float,
+        default=0.1,
+        help="Part maximale de lignes en quarantaine avant rejet du fichier (0-1)",
+    )
+
+
+def controler(
+    df: pd.DataFrame,
+    regles: Regles,
+    source: Path,
+    fichier_quarantaine: Path | None = None,
+    taux_rejet_max: float = 0.1,
+) -> pd.DataFrame:
+    """Point d'entrée des scripts d'import : valide, met en quarantaine, retourne les lignes propres.
+
+    Lève ``ValueError`` si la part de lignes en quarantaine dépasse ``taux_rejet_max``.
+    """
+    rapport = valider(df, regles)
+    if rapport.lignes_vides:
+        logger.info("%d lignes vides ignorées", rapport.lignes_vides)
+    journaliser_profil(rapport.profil)
+    if len(rapport.quarantaine):
+        cible = fichier_quarantaine or source.with_name(f"{source.stem}.quarantaine.csv")
+        ecrire_quarantaine(rapport.quarantaine, cible)
+    total = len(rapport.propres) + len(rapport.quarantaine)
+    if rapport.taux_quarantaine > taux_rejet_max:
+        raise ValueError(
+            f"Fichier rejeté: {len(rapport.quarantaine)}/{total} lignes invalides "
+            f"({rapport.taux_quarantaine:.0%} > {taux_rejet_max:.0%})"
+        )
+    logger.info("%d lignes valides sur %d", len(rapport.propres), total)
+    return rapport.propres
@@ -0,0 +1,110 @@
+"""Rejeu des imports sur le stock d'agrégats : ``appliquer`` puis ``verifier`` contre
+les faits que la base contiendrait après la procédure stockée."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts import agregats
+
+
+def fait(source, collaborateur, formation, jour, statut="Inscrit", duree=7.0, cout=100.0,
+         departement="IT", categorie="Langues"):
+    return dict(
+        source=source,
+        id_collaborateur=collaborateur,
+        nom_formation=formation,
+        date_inscription=pd.Timestamp(jour),
+        statut=statut,
+        duree=duree,
+        cout=cout,
+        departement=departement,
+        genre="Femme",
+        contrat="CDI",
+        categorie=categorie,
+    )
+
+
+@pytest.fixture
+def stock(tmp_path):
+    stock = agregats.StockAgregats(tmp_path)
+    stock.reconstruire(
+        pd.DataFrame(
+            [
+                fait("SUIVI_INTERNE", "C1", "F1", "2025-01-10", "Terminé"),
+                fait("OLU", "C2", "F2", "2025-02-03", cout=np.nan, categorie="Technique - Métiers"),
+            ]
+        )
+    )
+    return stock
+
+
+def test_suivi(stock):
+    stock.appliquer(
+        pd.DataFrame(
+            [
+                # Paire existante : ni date ni statut modifiés, département et tarif mis à jour
+                fait("SUIVI_INTERNE", "C1", "F1", "2025-03-01", "En cours", cout=120.0, departement="RH"),
+                # Formation existante : catégorie du stock, pas celle du fichier
+                fait("SUIVI_INTERNE", "C1", "F2", "2025-03-05", cout=50.0, departement="RH", categorie="Autre"),
+                # Paire déjà importée par OLU : ignorée
+                fait("SUIVI_INTERNE", "C2", "F2", "2025-03-05", "Terminé", cout=50.0),
+            ]
+        )
+    )
+    base = pd.DataFrame(
+        [
+            fait("SUIVI_INTERNE", "C1", "F1", "2025-01-10", "Terminé", cout=120.0, departement="RH"),
+            fait("OLU", "C2", "F2", "2025-02-03", cout=50.0, categorie="Technique - Métiers"),
+            fait("SUIVI_INTERNE", "C1", "F2", "2025-03-05", cout=50.0, departement="RH",
+                 categorie="Technique - Métiers"),
+        ]
+    )
+    assert stock.verifier(base).empty
+
+
+def test_suivi_sans_nouvelle_paire(stock, caplog):
+    caplog.set_level("INFO")
+    assert stock.appliquer(pd.DataFrame([fait("SUIVI_INTERNE", "C1", "F1", "2025-03-01")])) == [(2025, 1)]
+    assert "(0 faits ajoutés)" in caplog.text
+    faits = pd.read_parquet(stock._chemin("faits", 2025, 1))
+    assert len(faits) == 1
+
+
+def test_olu(stock):
+    stock.appliquer(
+        pd.DataFrame(
+            [
+                # MERGE : statut et durée mis à jour sur place, date conservée
+                fait("OLU", "C2", "F2", "2025-04-03", "Terminé", duree=3.0, cout=np.nan),
+                # Formation créée par le suivi : catégorie et tarif existants
+                fait("OLU", "C3", "F1", "2025-04-07", cout=np.nan, categorie="Technique - Métiers"),
+            ]
+        )
+    )
+    base = pd.DataFrame(
+        [
+            fait("SUIVI_INTERNE", "C1", "F1", "2025-01-10", "Terminé"),
+            fait("OLU", "C2", "F2", "2025-02-03", "Terminé", duree=3.0, cout=np.nan,
+                 categorie="Technique - Métiers"),
+            fait("OLU", "C3", "F1", "2025-04-07"),
+        ]
+    )
+    assert stock.verifier(base).empty
+
+
+def test_autre_source(stock):
+    stock.appliquer(pd.DataFrame([fait("PLAN", "C4", "F3", "2025-05-02")]))
+    stock.appliquer(pd.DataFrame([fait("PLAN", "C4", "F3", "2025-06-12", "Terminé")]))
+    base = pd.DataFrame(
+        [
+            fait("SUIVI_INTERNE", "C1", "F1", "2025-01-10", "Terminé"),
+            fait("OLU", "C2", "F2", "2025-02-03", cout=np.nan, categorie="Technique - Métiers"),
+            fait("PLAN", "C4", "F3", "2025-06-12", "Terminé"),
+        ]
+    )
+    assert stock.verifier(base).empty
+    assert (2025, 5) not in stock.partitions()
+
+
+def test_aucun_fait(stock):
+    assert stock.appliquer(agregats.concatener([])) == []